@@ -62,13 +62,23 @@ function Admin() {
   const studentsQ = useQuery({
     queryKey: ["students", mode, fromDate, toDate],
     queryFn: async () => {
-      const res =
-        mode === SP_MODE
-          ? await fetchBackend(
-              `/checkin/spStudents/?from_date=${fromDate}&to_date=${toDate}`,
-            )
-          : await fetchBackend(`/checkin/students/${mode}`);
-      return (await res.json()) as any[];
+      if (mode !== SP_MODE) {
+        const res = await fetchBackend(`/checkin/students/${mode}`);
+        return (await res.json()) as any[];
+      }
+      // Senior privileges records come in pages; follows next_cursor until the last one.
+      const records: any[] = [];
+      let cursor: string | null = null;
+      do {
+        const res = await fetchBackend(
+          `/checkin/spStudents/?from_date=${fromDate}&to_date=${toDate}` +
+            (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ""),
+        );
+        const page = await res.json();
+        records.push(...page.records);
+        cursor = page.next_cursor;
+      } while (cursor);
+      return records;
     },
   });
   const seniorYearQ = useQuery({
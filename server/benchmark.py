@@ -0,0 +1,413 @@
+"""
+Benchmarks the check-in flow against an in-process instance of the server,
+on a throwaway copy of the database (so it's safe to run next to a real one).
+
+For each free block, every student with that block goes through the kiosk flow
+(/userToken/ -> /run/, or /runTentative/ with a video upload), while dashboards poll
+/students/{free_block}/ and /spStudents/ and the kiosk polls /kioskToken/.
+Prints a latency summary per endpoint, and writes the full results as JSON.
+Afterwards, checks that /metrics renders the requests that were sent.
+
+Usage:
+    py benchmark.py --students 700 --concurrency 50 --output bench.json
+
+The database and settings come from the environment as usual,
+so ex. DB_ENGINE=postgresql or GROUP_COMMIT_WINDOW_MS=5 can be benchmarked too.
+(With group commits, the inserts aren't counted in the query counts,
+since each one is shared by a whole batch of requests.)
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django
+
+django.setup()
+
+import ffmpeg
+import httpx
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import override_settings
+
+from checkin.core.consts import ALL_FREE_BLOCKS, US_EASTERN
+from checkin.core.video_pipeline import video_pool
+from checkin.models import Student, FreeBlockToday
+from config import settings
+from config.asgi import application
+
+# Otherwise every request is logged.
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BASE_URL = "https://127.0.0.1"
+ADMIN_PASSWORD = uuid.uuid4().hex
+
+
+@dataclass
+class EndpointStats:
+    latencies_ms: list[float] = field(default_factory=list)
+    queries: list[int] = field(default_factory=list)
+    errors: int = 0
+
+    def summary(self, wall_secs: float):
+        latencies = sorted(self.latencies_ms)
+        return {
+            "requests": len(latencies),
+            "errors": self.errors,
+            "throughput_rps": round(len(latencies) / wall_secs, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "p99_ms": _percentile(latencies, 99),
+            "max_ms": round(latencies[-1], 2),
+            "queries_per_request": round(sum(self.queries) / len(self.queries), 2),
+        }
+
+
+@dataclass
+class _Sample:
+    queries: int = 0
+
+
+# The request being timed, so that queries (made on whichever thread) are counted towards it.
+_curr_sample: ContextVar[_Sample | None] = ContextVar("curr_sample", default=None)
+
+
+def _count_query(execute, sql, params, many, context):
+    sample = _curr_sample.get()
+    if sample is not None:
+        sample.queries += 1
+    return execute(sql, params, many, context)
+
+
+def _install_query_counter(sender, connection, **kwargs):
+    connection.execute_wrappers.append(_count_query)
+
+
+def _percentile(sorted_values: list[float], p: float):
+    idx = max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)
+    return round(sorted_values[idx], 2)
+
+
+class Benchmark:
+    def __init__(self, client: httpx.AsyncClient, args: argparse.Namespace):
+        self.client = client
+        self.args = args
+        self.stats: dict[str, EndpointStats] = {}
+        self.kiosk_token: str | None = None
+        self.sample_video: bytes | None = None
+        self.check_in_secs = 0.0
+        self.num_check_ins = 0
+
+    async def request(self, name: str, method: str, url: str, **kwargs):
+        """
+        Sends a request, recording its latency and query count under name.
+        """
+        sample = _Sample()
+        token = _curr_sample.set(sample)
+        start = time.perf_counter()
+        try:
+            res = await self.client.request(method, url, **kwargs)
+        finally:
+            _curr_sample.reset(token)
+        stats = self.stats.setdefault(name, EndpointStats())
+        stats.latencies_ms.append((time.perf_counter() - start) * 1000)
+        stats.queries.append(sample.queries)
+        if res.status_code >= 400:
+            stats.errors += 1
+        return res
+
+    async def run(self):
+        await self._seed()
+        res = await self.request(
+            "POST /adminLogin/",
+            "POST",
+            "/checkin/adminLogin/",
+            json={"password": ADMIN_PASSWORD},
+        )
+        if not res.json().get("success"):
+            raise RuntimeError("Couldn't log into the kiosk admin account.")
+        self.sample_video = _make_sample_video() if self.args.video_ratio else None
+        if self.args.video_ratio and self.sample_video is None:
+            print("FFmpeg isn't available, so tentative check-ins are skipped.")
+
+        start = time.perf_counter()
+        for i, block in enumerate(ALL_FREE_BLOCKS):
+            students = list(range(i, self.args.students, len(ALL_FREE_BLOCKS)))
+            await self._run_block(block, students)
+        wall_secs = time.perf_counter() - start
+
+        await self._check_metrics()
+
+        video_stats = None
+        if self.sample_video and video_pool._queue is not None:
+            try:
+                await asyncio.wait_for(video_pool._queue.join(), 120)
+            except asyncio.TimeoutError:
+                print("Timed out waiting for the video queue to drain.")
+            video_stats = video_pool.stats()
+        return {
+            "timestamp": datetime.now(US_EASTERN).isoformat(),
+            "config": {
+                **vars(self.args),
+                "db_vendor": connection.vendor,
+                "group_commit_window_ms": settings.GROUP_COMMIT_WINDOW_MS,
+                "video_compression_mode": settings.VIDEO_COMPRESSION_MODE,
+            },
+            "wall_secs": round(wall_secs, 2),
+            "check_ins_per_sec": round(self.num_check_ins / self.check_in_secs, 2),
+            "endpoints": {
+                name: stats.summary(wall_secs)
+                for name, stats in sorted(self.stats.items())
+            },
+            "video_queue": video_stats,
+        }
+
+    async def _check_metrics(self):
+        """
+        Checks that /metrics is mounted and renders the check-ins that were just sent.
+        """
+        res = await self.client.get("/metrics")
+        expected = (
+            'http_request_duration_seconds_count{method="POST",route="/checkin/run/"}'
+        )
+        if res.status_code != 200 or expected not in res.text:
+            raise RuntimeError(
+                f"/metrics didn't render the check-in route (status {res.status_code})."
+            )
+
+    async def _seed(self):
+        await Student.objects.abulk_create(
+            [
+                Student(
+                    email=_email(i),
+                    name=f"Student {i}",
+                    is_senior=i % self.args.senior_every == 0,
+                    free_blocks=Student.as_bit_str(
+                        ALL_FREE_BLOCKS[i % len(ALL_FREE_BLOCKS)]
+                    ),
+                )
+                for i in range(self.args.students)
+            ],
+            batch_size=500,
+        )
+        user = User(username="Kiosk", is_staff=True, is_superuser=True)
+        user.set_password(ADMIN_PASSWORD)
+        await user.asave()
+
+    async def _run_block(self, block: str, students: list[int]):
+        now = datetime.now(US_EASTERN)
+        await FreeBlockToday.objects.all().adelete()
+        await FreeBlockToday.objects.acreate(
+            block=block, start=now - timedelta(minutes=5), end=now + timedelta(hours=1)
+        )
+        await self._poll_kiosk_token()
+
+        done = asyncio.Event()
+        pollers = [
+            asyncio.create_task(self._kiosk(done)),
+            *[
+                asyncio.create_task(self._dashboard(block, done))
+                for _ in range(self.args.dashboards)
+            ],
+        ]
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+
+        async def check_in(i: int):
+            async with semaphore:
+                await self._check_in(i)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(check_in(i) for i in students))
+        self.check_in_secs += time.perf_counter() - start
+        self.num_check_ins += len(students)
+        done.set()
+        await asyncio.gather(*pollers)
+
+    async def _check_in(self, i: int):
+        is_senior = i % self.args.senior_every == 0
+        data = {
+            "email": _email(i),
+            "device_id": uuid.uuid4().hex,
+            "mode": "sp_check_out" if is_senior else None,
+        }
+        if self.sample_video and random.random() < self.args.video_ratio:
+            await self.request(
+                "POST /runTentative/",
+                "POST",
+                "/checkin/runTentative/",
+                data={"input_data": json.dumps(data)},
+                files={"raw_video": ("video.webm", self.sample_video, "video/webm")},
+            )
+            return
+        res = await self.request(
+            "GET /userToken/",
+            "GET",
+            "/checkin/userToken/",
+            params={"kiosk_token": self.kiosk_token},
+        )
+        if res.status_code != 200:
+            return
+        await self.request(
+            "POST /run/",
+            "POST",
+            "/checkin/run/",
+            json={**data, "user_token": res.json()["token"]},
+        )
+
+    async def _kiosk(self, done: asyncio.Event):
+        while not done.is_set():
+            await self._poll_kiosk_token()
+            await _wait(done, 1)
+
+    async def _poll_kiosk_token(self):
+        res = await self.request("GET /kioskToken/", "GET", "/checkin/kioskToken/")
+        self.kiosk_token = res.json()["token"]
+
+    async def _dashboard(self, block: str, done: asyncio.Event):
+        # Dashboards start at different times, like they would in reality.
+        await _wait(done, random.uniform(0, self.args.poll_interval))
+        etag = None
+        while not done.is_set():
+            res = await self.request(
+                "GET /students/{free_block}/",
+                "GET",
+                f"/checkin/students/{block}/",
+                headers={"If-None-Match": etag} if etag else {},
+            )
+            etag = res.headers.get("ETag", etag)
+            await self.request("GET /spStudents/", "GET", "/checkin/spStudents/")
+            await _wait(done, self.args.poll_interval)
+
+
+async def _wait(done: asyncio.Event, secs: float):
+    try:
+        await asyncio.wait_for(done.wait(), secs)
+    except asyncio.TimeoutError:
+        pass
+
+
+def _email(i: int):
+    return f"student_{i}@caryacademy.org"
+
+
+def _make_sample_video() -> bytes | None:
+    """
+    Renders a short test pattern video, like the ones kiosks upload.
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "sample.webm")
+        try:
+            (
+                ffmpeg.input("testsrc=duration=3:size=640x480:rate=30", f="lavfi")
+                .output(path, vcodec="libvpx", **{"b:v": "1M"})
+                .run(quiet=True)
+            )
+        except (ffmpeg.Error, FileNotFoundError):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+
+def _print_summary(results: dict):
+    print(
+        f"\n{results['check_ins_per_sec']} check-ins/sec "
+        f"({results['config']['students']} students, {results['wall_secs']} secs)\n"
+    )
+    columns = (
+        "requests",
+        "errors",
+        "p50_ms",
+        "p95_ms",
+        "p99_ms",
+        "queries_per_request",
+    )
+    widths = [len(c) + 2 for c in columns]
+    print(f"{'endpoint':<28}" + "".join(f"{c:>{w}}" for c, w in zip(columns, widths)))
+    for name, summary in results["endpoints"].items():
+        print(
+            f"{name:<28}"
+            + "".join(f"{summary[c]:>{w}}" for c, w in zip(columns, widths))
+        )
+
+
+async def _main(args: argparse.Namespace):
+    transport = httpx.ASGITransport(app=application)
+    async with httpx.AsyncClient(transport=transport, base_url=BASE_URL) as client:
+        return await Benchmark(client, args).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--students", type=int, default=700)
+    parser.add_argument(
+        "--concurrency", type=int, default=50, help="Check-ins in flight at once."
+    )
+    parser.add_argument(
+        "--dashboards", type=int, default=3, help="Dashboards polling at once."
+    )
+    parser.add_argument(
+        "--poll-interval", type=float, default=2, help="Secs between dashboard polls."
+    )
+    parser.add_argument(
+        "--video-ratio",
+        type=float,
+        default=0.1,
+        help="The ratio of check-ins that upload a video through /runTentative/.",
+    )
+    parser.add_argument(
+        "--senior-every",
+        type=int,
+        default=4,
+        help="Every nth student is a senior, who checks out for senior privileges.",
+    )
+    parser.add_argument("--output", help="Where to write the results as JSON.")
+    args = parser.parse_args()
+
+    if connection.vendor == "sqlite":
+        # Benchmarks an on-disk database, since an in-memory one skips all the fsyncs.
+        connection.settings_dict["TEST"]["NAME"] = str(
+            settings.BASE_DIR / "benchmark.sqlite3"
+        )
+    db_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    connection_created.connect(_install_query_counter)
+    try:
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+            MEDIA_ROOT=media_root
+        ):
+            results = asyncio.run(_main(args))
+    finally:
+        test_db_name = connection.settings_dict["NAME"]
+        connection.creation.destroy_test_db(db_name, verbosity=0)
+        if connection.vendor == "sqlite":
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists(f"{test_db_name}{suffix}"):
+                    os.remove(f"{test_db_name}{suffix}")
+
+    _print_summary(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
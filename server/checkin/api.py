@@ -7,15 +7,21 @@ import logging
 import random
 import uuid
 from datetime import datetime, timezone, timedelta
+from typing import Literal
 
 import ninja
 
 from asgiref.sync import sync_to_async
 from django.contrib.auth import aauthenticate, alogin
 from django.db import IntegrityError
-from django.db.models import Prefetch
-from django.http import HttpRequest, FileResponse, HttpResponse
-from ninja import UploadedFile, File
+from django.http import (
+    HttpRequest,
+    FileResponse,
+    HttpResponse,
+    HttpResponseNotModified,
+    StreamingHttpResponse,
+)
+from ninja import UploadedFile, File, Query
 
 from checkin.core.api_methods import (
     get_curr_free_block,
@@ -23,9 +29,12 @@ from checkin.core.api_methods import (
     parse_email,
     get_check_in_record,
     get_perms,
+    CheckInRecord,
     fmt_eastern_date,
 )
-from checkin.core.compress_video import compress_video
+from checkin.core.block_rosters import block_rosters, student_status
+from checkin.core.change_feed import change_feed
+from checkin.core.compress_video import stream_compress_video
 from checkin.core.consts import ALL_FREE_BLOCKS, FreeBlock, EVERYONE_KW, US_EASTERN
 from checkin.core.errors import (
     InvalidFreeBlock,
@@ -34,7 +43,21 @@ from checkin.core.errors import (
     Http400,
 )
 from checkin.core.get_now import get_now
-from checkin.core.random_token_manager import RandomTokenManager
+from checkin.core.group_commit import save_check_in
+from checkin.core.shared_state import shared_state
+from checkin.core.signed_tokens import signed_tokens
+from checkin.core.sp_bans import sp_bans
+from checkin.core.sp_history import (
+    PAGE_SIZE,
+    sp_records,
+    sp_page,
+    iter_sp_records,
+    decode_cursor,
+    ndjson_lines,
+    csv_lines,
+)
+from checkin.core.sse import sse_event, sse_response, KEEP_ALIVE, KEEP_ALIVE_SECS
+from checkin.core.video_pipeline import video_pool, VideoJob
 from checkin.models import (
     Student,
     FreePeriodCheckIn,
@@ -51,11 +74,10 @@ from config import settings
 
 router = ninja.Router()
 
-kiosk_token_manager = RandomTokenManager(interval_secs=5)
-user_tokens = []
-user_tokens_lock = asyncio.Lock()
 logger = logging.getLogger(__name__)
 
+tokens = signed_tokens if settings.TOKEN_MODE == "signed" else shared_state
+
 
 @router.get("/kioskToken/")
 async def token_for_kiosk(request: HttpRequest):
@@ -64,7 +86,24 @@ async def token_for_kiosk(request: HttpRequest):
     )
     if not perms.get("isAdmin"):
         return HttpResponse(status=403)
-    token = kiosk_token_manager.get()
+    return await _kiosk_token(curr_free_block)
+
+
+@router.get("/kioskTokenStream/")
+async def kiosk_token_stream(request: HttpRequest):
+    """
+    Pushes the kiosk token and current free block as server-sent events,
+    every time the token rotates or a free block starts/ends.
+    The kiosk only authenticates once when connecting, instead of on every poll;
+    /kioskToken/ is kept for kiosks that still poll.
+    """
+    if not (await get_perms(request)).get("isAdmin"):
+        return HttpResponse(status=403)
+    return sse_response(_kiosk_token_events())
+
+
+async def _kiosk_token(curr_free_block: FreeBlock | None):
+    token = await tokens.kiosk_token()
     token["curr_free_block"] = curr_free_block
     if curr_free_block is None:
         _, delta_time = await get_next_free_block()
@@ -74,14 +113,26 @@ async def token_for_kiosk(request: HttpRequest):
     return token
 
 
+async def _kiosk_token_events():
+    last_sent = None
+    while True:
+        token = await _kiosk_token(await get_curr_free_block())
+        if (token["token"], token["curr_free_block"]) != last_sent:
+            last_sent = (token["token"], token["curr_free_block"])
+            yield sse_event(token)
+        secs_left = token["time_until_refresh"]
+        while secs_left > KEEP_ALIVE_SECS:
+            await asyncio.sleep(KEEP_ALIVE_SECS)
+            secs_left -= KEEP_ALIVE_SECS
+            yield KEEP_ALIVE
+        await asyncio.sleep(secs_left)
+
+
 @router.get("/userToken/")
 async def token_for_student(request, kiosk_token: str):
-    if not kiosk_token_manager.validate(kiosk_token):
+    if not await tokens.is_valid_kiosk_token(kiosk_token):
         return HttpResponse("Invalid token", status=403)
-    token = str(uuid.uuid4())
-    async with user_tokens_lock:
-        user_tokens.append(token)
-    return {"token": token}
+    return {"token": await tokens.issue_user_token()}
 
 
 @router.get("/seniorYear/")
@@ -94,71 +145,120 @@ def senior_year(request):
 
 
 @router.get("/students/{free_block}/")
-async def fetch_students(request, free_block: FreeBlock):
+async def fetch_students(request, response: HttpResponse, free_block: FreeBlock):
     if free_block not in ALL_FREE_BLOCKS:
         return InvalidFreeBlock()
-    output = []
-    records_prefetch = Prefetch(
-        "fp_records",
-        queryset=FreePeriodCheckIn.objects.filter(
-            free_block_idx=ALL_FREE_BLOCKS.index(free_block)
-        ),
-        to_attr="fp_records_filtered",
-    )
-    students = Student.objects.filter(free_blocks=Student.as_bit_str(free_block))
-    students = students.prefetch_related(records_prefetch)
-    async for student in students.all():
-        records: list[FreePeriodCheckIn] = student.fp_records_filtered
-        if len(records) == 0:
-            status = "nothing"
-        elif records[0].video.name:
-            status = "tentative"
-        else:
-            status = "checked_in"
-        output.append({"name": student.name, "email": student.email, "status": status})
-    return output
+    roster, etag = await block_rosters.get(free_block)
+    if request.headers.get("If-None-Match") == etag:
+        return HttpResponseNotModified()
+    response["ETag"] = etag
+    return roster
 
 
 @router.get("/spStudents/")
-async def fetch_sp_students(request, from_date=None, to_date=None):
-    from_date = fmt_eastern_date(from_date)
-    to_date = fmt_eastern_date(to_date)
+async def fetch_sp_students(
+    request,
+    from_date=None,
+    to_date=None,
+    limit: int = Query(PAGE_SIZE, ge=1, le=PAGE_SIZE),
+    cursor: str | None = None,
+    format: Literal["json", "ndjson", "csv"] = "json",
+):
+    """
+    Lists senior privileges records, ordered by check out date.
+    Returns one page of up to limit= records (PAGE_SIZE by default) and the cursor= to pass for the next one.
+    With format=ndjson or csv, streams every record in the range without loading them all at once.
+    """
+    records = sp_records(fmt_eastern_date(from_date), fmt_eastern_date(to_date))
+    after = decode_cursor(cursor) if cursor else None
+    if format == "ndjson":
+        return StreamingHttpResponse(
+            ndjson_lines(iter_sp_records(records, after)),
+            content_type="application/x-ndjson",
+        )
+    if format == "csv":
+        response = StreamingHttpResponse(
+            csv_lines(iter_sp_records(records, after)), content_type="text/csv"
+        )
+        response["Content-Disposition"] = 'attachment; filename="sp_records.csv"'
+        return response
+    page, next_cursor = await sp_page(records, after, limit)
+    return {"records": [r.dict() for r in page], "next_cursor": next_cursor}
 
-    output = []
-    records = SeniorPrivilegeCheckIn.objects.select_related("student")
-    if from_date:
-        records = records.filter(check_out_date__gte=from_date)
-    if to_date:
-        records = records.filter(check_out_date__lte=to_date)
-    if not from_date and not to_date:
-        records = records.filter(check_out_date__date=datetime.now(US_EASTERN).date())
 
-    async for r in records.all():
-        output.append(r.dict())
-    return output
+async def _todays_sp_students():
+    return [r.dict() async for r in sp_records(None, None)]
+
+
+@router.get("/changes/")
+async def check_in_changes(
+    request: HttpRequest,
+    free_block: FreeBlock | None = None,
+    since: str | None = None,
+):
+    """
+    Streams check-in changes to a dashboard as server-sent events.
+    The stream starts with a "snapshot" event, holding what /students/{free_block}/
+    (or /spStudents/ for today, if no free block is given) would return,
+    then sends a "change" event with the student's new row each time someone checks in.
+    Reconnecting with since= (or the Last-Event-ID header, which EventSource sends)
+    resumes the stream without a new snapshot, as long as the missed changes are still kept.
+    """
+    if free_block is not None and free_block not in ALL_FREE_BLOCKS:
+        return InvalidFreeBlock()
+    last_seq = change_feed.parse_event_id(since or request.headers.get("Last-Event-ID"))
+    return sse_response(_check_in_change_events(free_block, last_seq))
+
+
+async def _check_in_change_events(free_block: FreeBlock | None, last_seq: int | None):
+    while True:
+        changes = None if last_seq is None else change_feed.since(last_seq)
+        if changes is None:
+            last_seq = change_feed.seq
+            if free_block:
+                students, _ = await block_rosters.get(free_block)
+            else:
+                students = await _todays_sp_students()
+            yield sse_event(
+                {"students": students}, "snapshot", change_feed.event_id(last_seq)
+            )
+            continue
+        for seq, change in changes:
+            if change["block"] == free_block:
+                yield sse_event(
+                    {"student": change["student"]}, "change", change_feed.event_id(seq)
+                )
+        if changes:
+            last_seq = changes[-1][0]
+        if not await change_feed.wait(KEEP_ALIVE_SECS):
+            yield KEEP_ALIVE
 
 
 @router.post("/clearSpCheckIns/")
 async def clear_sp_check_ins(request):
     await SeniorPrivilegeCheckIn.objects.exclude(
-        check_out_date__date=datetime.now().date()
+        check_out_day=datetime.now(US_EASTERN).date()
     ).adelete()
     return {"success": True}
 
 
 @router.get("/studentVid/")
 async def student_vid(request, free_block: FreeBlock, email: str):
-    record = await FreePeriodCheckIn.objects.filter(
-        free_block_idx=ALL_FREE_BLOCKS.index(free_block),
-        student__email=email.lower(),
-        video__isnull=False,
-    ).afirst()
+    record = await student_video_query(free_block, email).afirst()
     if not record:
         return NoVideoFound()
     file = record.video.file
     return FileResponse(file.open(), as_attachment=True, filename=file.name)
 
 
+def student_video_query(free_block: FreeBlock, email: str):
+    # Empty FileFields are stored as "", not NULL.
+    return FreePeriodCheckIn.objects.filter(
+        free_block_idx=ALL_FREE_BLOCKS.index(free_block),
+        student__email=email.lower(),
+    ).exclude(video="")
+
+
 @router.get("/studentExists/{email_or_id}")
 async def student_exists(request, email_or_id: str):
     email = await parse_email(email_or_id)
@@ -176,18 +276,25 @@ async def perms_endpoint(request):
 
 @router.post("/run/")
 async def check_in_student(request, data: CheckInSchema):
-    if data.user_token not in user_tokens:
+    expires_at = await tokens.consume_user_token(data.user_token)
+    if expires_at is None:
         logger.info(f"USER TOKEN: {data.user_token}")
         return HttpResponse("Invalid token", status=403)
-    record = await get_check_in_record(data.email, data.mode, data.device_id)
-    if isinstance(record, Http400):
-        return record
+    saved = False
     try:
-        await record.model.asave()
-    except IntegrityError:
-        return DeviceIdConflict()
-    async with user_tokens_lock:
-        user_tokens.remove(data.user_token)
+        record = await get_check_in_record(data.email, data.mode, data.device_id)
+        if isinstance(record, Http400):
+            return record
+        try:
+            await save_check_in(record.model)
+        except IntegrityError:
+            return DeviceIdConflict()
+        saved = True
+    finally:
+        if not saved:
+            # Lets the student retry with the same token (ex. after picking a mode).
+            await tokens.restore_user_token(data.user_token, expires_at)
+    _on_record_saved(record)
     return {"successMsg": record.msg}
 
 
@@ -200,15 +307,40 @@ async def check_in_student_tentative(
     )
     if isinstance(record, Http400):
         return record
+    uin = input_data.email.replace("@caryacademy.org", "")
+    if settings.VIDEO_COMPRESSION_MODE == "streaming":
+        video_name = record.model.video.field.generate_filename(
+            record.model, f"{uin}-{record.model.name()}.webm"
+        )
+        record.model.video.name = await video_pool.run(
+            stream_compress_video, raw_video, video_name
+        )
+        video_status = "done"
+    else:
+        # The raw upload is attached right away, so the record shows up as tentative;
+        # video_pool swaps in the compressed version once it's done.
+        await sync_to_async(record.model.video.save)(
+            f"raw/{uin}-{record.model.name()}.webm", raw_video, save=False
+        )
+        video_status = "pending"
     try:
-        uin = input_data.email.replace("@caryacademy.org", "")
-        raw_video.name = f"{uin}-{record.model.name()}.webm"
-        with compress_video(raw_video) as video_file:
-            await sync_to_async(record.model.video.save)(video_file.name, video_file)
-        await record.model.asave()
+        await save_check_in(record.model)
     except IntegrityError:
+        await sync_to_async(record.model.video.delete)(save=False)
         return DeviceIdConflict()
-    return {"successMsg": record.msg}
+    _on_record_saved(record)
+    if video_status == "pending":
+        await video_pool.submit(
+            VideoJob(type(record.model), record.model.pk, record.model.video.name)
+        )
+    return {"successMsg": record.msg, "videoStatus": video_status}
+
+
+@router.get("/videoQueue/")
+async def video_queue_stats(request):
+    if not (await get_perms(request)).get("isAdmin"):
+        return HttpResponse(status=403)
+    return video_pool.stats()
 
 
 @router.post("/runManual/")
@@ -220,12 +352,23 @@ async def check_in_student_manual(request: HttpRequest, data: ManualCheckInSchem
     if isinstance(record, Http400):
         return record
     try:
-        await record.model.asave()
+        await save_check_in(record.model)
+        _on_record_saved(record)
     except IntegrityError:
         pass
     return {"successMsg": record.msg}
 
 
+def _on_record_saved(record: CheckInRecord):
+    if isinstance(record.model, FreePeriodCheckIn):
+        block_rosters.set_status(record.model)
+        change_feed.publish(
+            {"block": record.model.block(), "student": student_status(record.model)}
+        )
+    else:
+        change_feed.publish({"block": None, "student": record.model.dict()})
+
+
 @router.post("/adminLogin/")
 async def admin_login(request: HttpRequest, data: AdminLoginSchema):
     res = await aauthenticate(request, username="Kiosk", password=data.password)
@@ -242,18 +385,13 @@ async def admin_login(request: HttpRequest, data: AdminLoginSchema):
 
 @router.get("/allSeniors/")
 async def fetch_all_seniors(request):
-    seniors = Student.objects.filter(is_senior=True)
-    banned_emails = []
-    async for ban in SeniorPrivilegesBan.objects.all():
-        if ban.is_for == EVERYONE_KW:
-            return [
-                {"name": s.name, "email": s.email, "has_sp": False}
-                async for s in seniors
-            ]
-        banned_emails.append(ban.is_for)
     return [
-        {"name": s.name, "email": s.email, "has_sp": s.email not in banned_emails}
-        async for s in seniors
+        {
+            "name": s.name,
+            "email": s.email,
+            "has_sp": not await sp_bans.applies_to(s.email),
+        }
+        async for s in Student.objects.filter(is_senior=True)
     ]
 
 
@@ -263,11 +401,13 @@ async def enable_senior_privileges(request, is_for: str = EVERYONE_KW):
         return HttpResponse(status=403)
     if is_for == EVERYONE_KW:
         await SeniorPrivilegesBan.objects.all().adelete()
+        await sp_bans.ainvalidate()
         return {"success": True}
     else:
         ban = await SeniorPrivilegesBan.objects.filter(is_for=is_for).afirst()
         if ban:
             await ban.adelete()
+            await sp_bans.ainvalidate()
             return {"success": True}
         else:
             return {"success": False}
@@ -280,6 +420,7 @@ async def disable_senior_privileges(request, is_for: str = EVERYONE_KW):
     if is_for == EVERYONE_KW:
         await SeniorPrivilegesBan.objects.all().adelete()
     await SeniorPrivilegesBan.objects.acreate(is_for=is_for)
+    await sp_bans.ainvalidate()
     return {"success": True}
 
 
@@ -324,6 +465,9 @@ if settings.DEBUG:
                         check_out_date=datetime.now(timezone.utc),
                     )
                 )
+        # bulk_create skips save(), which usually fills this in
+        for obj in objs:
+            obj.check_out_day = obj.check_out_date.astimezone(US_EASTERN).date()
         await SeniorPrivilegeCheckIn.objects.abulk_create(objs)
 
     @router.get("/test/eraseSpCheckIns/")
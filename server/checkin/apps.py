@@ -9,10 +9,11 @@ class CheckinConfig(AppConfig):
         from django.db.backends.signals import connection_created
         from django.dispatch import receiver
 
-        @receiver(connection_created)
+        from checkin.core.sqlite_tuning import apply_pragmas
+
+        # weak=False, since nothing else holds on to this function once ready() returns.
+        @receiver(connection_created, weak=False)
         def setup_sqlite_pragmas(sender, connection, **kwargs):
+            # PostgreSQL handles concurrent writers itself, so these only apply to SQLite.
             if connection.vendor == "sqlite":
-                cursor = connection.cursor()
-                cursor.execute("PRAGMA journal_mode=wal;")
-                cursor.execute("PRAGMA busy_timeout=5000;")
-                cursor.close()
+                apply_pragmas(connection)
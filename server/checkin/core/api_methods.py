@@ -3,6 +3,7 @@ import logging
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 
+from django.db.models import F, FilteredRelation, Q, QuerySet
 from django.http import HttpRequest
 
 from checkin.core.errors import (
@@ -15,16 +16,17 @@ from checkin.core.errors import (
     NoSeniorPrivileges,
     Http400,
 )
+from checkin.core.free_block_schedule import free_block_schedule
 from checkin.core.get_now import get_now
+from checkin.core.sp_bans import sp_bans
+from checkin.core.student_ids import student_ids, fetched_emails
 from checkin.core.consts import FreeBlock, CheckInOption, US_EASTERN, SP_ADDENDUM
 from checkin.models import (
-    FreeBlockToday,
     Student,
     FreePeriodCheckIn,
     SeniorPrivilegeCheckIn,
-    SeniorPrivilegesBan,
 )
-from oauth.api import oauth_client
+from oauth.client import blackbaud_client
 
 logger = logging.getLogger(__name__)
 
@@ -36,21 +38,14 @@ class CheckInRecord:
 
 
 async def get_curr_free_block() -> FreeBlock | None:
-    now = get_now()
-    async for item in FreeBlockToday.objects.all():
-        time_from_start = (now - item.start).total_seconds()
-        time_from_end = (item.end - now).total_seconds()
-        if time_from_start > 0 and time_from_end > 0:
-            return item.block
-    return None
+    return await free_block_schedule.current(get_now())
 
 
 async def get_next_free_block() -> (FreeBlock | None, float):
     now = get_now()
-    async for item in FreeBlockToday.objects.all():
-        delta_secs = (now - item.start).total_seconds()
-        if delta_secs < 0:
-            return item.block, abs(delta_secs)
+    item = await free_block_schedule.next(now)
+    if item:
+        return item.block, (item.start - now).total_seconds()
     # If we're done for free blocks for today, re-send a request at tomorrow 8:30
     tomorrow_830 = now.replace(hour=8, minute=30, second=0)
     delta_secs = (tomorrow_830 - now).total_seconds()
@@ -63,14 +58,21 @@ async def get_next_free_block() -> (FreeBlock | None, float):
 async def parse_email(email_or_id: str):
     if not email_or_id.isdigit():
         return email_or_id.lower()
-    client = await oauth_client()
+    bb_id = int(email_or_id)
+    email = await student_ids.email_of(bb_id) or fetched_emails.get(bb_id)
+    if email:
+        return email
+    # Only IDs that weren't in today's roster need to be looked up on Blackbaud.
+    client = await blackbaud_client()
     try:
-        res = await client.get(f"/users/{email_or_id}")
+        # The student is waiting at the kiosk, so don't wait long on rate limits.
+        res = await client.get(f"/users/{email_or_id}", max_wait_secs=2)
         if res.status_code == 429:
             raise UseEmailInstead
         email = res.json().get("email")
         if not email:
             raise InvalidStudent
+        fetched_emails.set(bb_id, email.lower())
         return email.lower()
     except ValueError:
         raise InvalidStudent
@@ -80,14 +82,16 @@ async def get_check_in_record(
     email: str, mode: CheckInOption, device_id: str
 ) -> CheckInRecord | Http400:
     email = email.lower()
-    free_block, student = await asyncio.gather(
-        get_curr_free_block(), Student.objects.filter(email=email).afirst()
+    free_block, student, banned_from_sp = await asyncio.gather(
+        get_curr_free_block(),
+        _fetch_student_for_check_in(email),
+        sp_bans.applies_to(email),
     )
     if student is None:
         return InvalidStudent()
 
     is_sp_mode = mode in ["sp_check_in", "sp_check_out"]
-    banned_from_sp = await SeniorPrivilegesBan.applies_to(email)
+    banned_from_sp = student.is_senior and banned_from_sp
     has_sp = student.is_senior and not banned_from_sp
     if has_sp and mode is None:
         return ModeRequiredForSenior()
@@ -104,14 +108,13 @@ async def get_check_in_record(
             msg += SP_ADDENDUM
         return CheckInRecord(record, msg)
     elif is_sp_mode:
-        record = await SeniorPrivilegeCheckIn.objects.filter(
-            student__email=email,
-            check_out_date__date=datetime.now().date(),
-        ).afirst()
+        record = _todays_sp_record(student)
         if record and not record.checked_out and mode == "sp_check_in":
             return HasNotCheckedOut()
         if not record:
-            record = SeniorPrivilegeCheckIn(student=student)
+            record = SeniorPrivilegeCheckIn(
+                student=student, check_out_date=datetime.now(US_EASTERN)
+            )
         elif record.device_id != device_id:
             return DeviceIdConflict()
         record.device_id = device_id
@@ -127,10 +130,51 @@ async def get_check_in_record(
         raise Exception("Invalid mode: schema err")
 
 
-async def get_emails_from_grad_year(grad_year: int):
-    from oauth.api import oauth_client
+_SP_FIELDS = (
+    "id",
+    "device_id",
+    "checked_out",
+    "check_out_date",
+    "check_in_date",
+    "video",
+)
+
 
-    client = await oauth_client()
+async def _fetch_student_for_check_in(email: str) -> Student | None:
+    return await student_for_check_in(email).afirst()
+
+
+def student_for_check_in(email: str) -> QuerySet[Student]:
+    """
+    Queries a student along with their senior privileges record for today,
+    so that get_check_in_record only needs one read.
+    """
+    return Student.objects.filter(email=email).annotate(
+        sp_today=FilteredRelation(
+            "seniorprivilegecheckin",
+            condition=Q(
+                seniorprivilegecheckin__check_out_day=datetime.now(US_EASTERN).date()
+            ),
+        ),
+        **{f"sp_{field}": F(f"sp_today__{field}") for field in _SP_FIELDS},
+    )
+
+
+def _todays_sp_record(student: Student) -> SeniorPrivilegeCheckIn | None:
+    """
+    Rebuilds the senior privileges record annotated by _fetch_student_for_check_in.
+    Since the id is set, saving it updates the existing row.
+    """
+    if student.sp_id is None:
+        return None
+    return SeniorPrivilegeCheckIn(
+        student=student,
+        **{field: getattr(student, f"sp_{field}") for field in _SP_FIELDS},
+    )
+
+
+async def get_emails_from_grad_year(grad_year: int):
+    client = await blackbaud_client()
     res = await client.get(f"/users?roles=4180&grad_year={grad_year}")
     return [data.get("email") for data in res.json()["value"] if data.get("email")]
 
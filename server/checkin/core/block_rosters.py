@@ -0,0 +1,126 @@
+import uuid
+
+from django.db.models import Max, QuerySet
+
+from checkin.core.consts import ALL_FREE_BLOCKS, FreeBlock
+from checkin.core.daily_cache import DailyCache
+from checkin.models import Student, FreePeriodCheckIn
+
+StudentStatus = dict[str, str]
+
+
+def roster_students() -> QuerySet[Student]:
+    """
+    Every student with a free block, with their check-ins prefetched.
+    """
+    return Student.objects.filter(free_blocks__gt=0).prefetch_related("fp_records")
+
+
+def check_ins_after(record_id: int) -> QuerySet[FreePeriodCheckIn]:
+    return (
+        FreePeriodCheckIn.objects.filter(id__gt=record_id)
+        .select_related("student")
+        .order_by("id")
+    )
+
+
+class BlockRosters(DailyCache):
+    """
+    Each free block's roster of students and their check-in status,
+    precomputed so that dashboard polls don't rebuild it from the db every time.
+    Check-ins saved by this process update it in place (see set_status()),
+    and those saved by other processes are applied every VERSION_CHECK_SECS (see _catch_up()),
+    instead of reloading every roster.
+    """
+
+    def __init__(self):
+        super().__init__("block_rosters")
+        # Makes ETags from different processes (or restarts) distinct.
+        self._instance_id = uuid.uuid4().hex[:8]
+        self._num_loads = 0
+        self._rosters: dict[FreeBlock, dict[str, StudentStatus]] = {}
+        self._versions: dict[FreeBlock, int] = {}
+        self._lists: dict[FreeBlock, list[StudentStatus]] = {}
+        # Check-ins with a higher id haven't been applied by _catch_up() yet.
+        self._max_record_id = 0
+
+    async def _load(self):
+        # Read first, so that check-ins saved mid-load are applied again by _catch_up().
+        aggregate = await FreePeriodCheckIn.objects.aaggregate(max_id=Max("id"))
+        rosters = {block: {} for block in ALL_FREE_BLOCKS}
+        async for student in roster_students():
+            records = {r.free_block_idx: r for r in student.fp_records.all()}
+            for idx, block in enumerate(ALL_FREE_BLOCKS):
+                if int(student.free_blocks) & (1 << idx):
+                    rosters[block][student.email] = {
+                        "name": student.name,
+                        "email": student.email,
+                        "status": status_of(records.get(idx)),
+                    }
+        self._num_loads += 1
+        self._rosters = rosters
+        self._versions = {block: 0 for block in ALL_FREE_BLOCKS}
+        self._lists = {}
+        self._max_record_id = aggregate["max_id"] or 0
+
+    async def _catch_up(self):
+        # Ids only increase, so new check-ins are the ones with higher ids (on PostgreSQL,
+        # one committed out of order can be missed until the next reload).
+        async for record in check_ins_after(self._max_record_id):
+            self.set_status(record)
+            self._max_record_id = max(self._max_record_id, record.id)
+
+    async def get(self, block: FreeBlock) -> tuple[list[StudentStatus], str]:
+        """
+        Fetches the roster of a free block, along with an ETag for its current contents.
+        """
+        await self.ensure_loaded()
+        if block not in self._lists:
+            self._lists[block] = list(self._rosters[block].values())
+        return self._lists[block], self.etag(block)
+
+    def etag(self, block: FreeBlock) -> str:
+        return f'W/"{self._instance_id}-{self._num_loads}-{self._versions[block]}"'
+
+    def set_status(self, record: FreePeriodCheckIn):
+        """
+        Updates a student's status after their check-in record has been saved.
+        The student must already be fetched on the record.
+        Setting the same status again is a no-op, so records can be applied more than once.
+        """
+        if self._lock.locked():
+            # A reload might have read the db before this record was saved.
+            self.invalidate()
+        if not self._rosters:
+            return
+        block = record.block()
+        status = student_status(record)
+        if self._rosters[block].get(record.student.email) == status:
+            return
+        self._rosters[block][record.student.email] = status
+        self._versions[block] += 1
+        self._lists.pop(block, None)
+
+
+def student_status(record: FreePeriodCheckIn) -> StudentStatus:
+    """
+    Fetches a roster entry for the student of a check-in record.
+    The student must already be fetched on the record.
+    """
+    return {
+        "name": record.student.name,
+        "email": record.student.email,
+        "status": status_of(record),
+    }
+
+
+def status_of(record: FreePeriodCheckIn | None):
+    if record is None:
+        return "nothing"
+    elif record.video.name:
+        return "tentative"
+    else:
+        return "checked_in"
+
+
+block_rosters = BlockRosters()
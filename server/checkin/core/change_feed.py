@@ -0,0 +1,63 @@
+import asyncio
+import uuid
+
+from collections import deque
+from itertools import islice
+
+
+class ChangeFeed:
+    """
+    A sequence-numbered feed of check-in changes, so dashboards can stream them
+    instead of re-downloading whole rosters.
+    The last max_history changes are kept, so that a reconnecting client can resume
+    from the last event id it saw; if that's too old (or from another process),
+    it needs a new snapshot instead.
+    """
+
+    def __init__(self, max_history: int = 2000):
+        # Event ids are "<feed_id>:<seq>", so ids from before a restart are never mistaken as resumable.
+        self.feed_id = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self._history: deque[tuple[int, dict]] = deque(maxlen=max_history)
+        self._new_change = asyncio.Event()
+
+    def publish(self, change: dict):
+        self.seq += 1
+        self._history.append((self.seq, change))
+        self._new_change.set()
+        self._new_change = asyncio.Event()
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.feed_id}:{seq}"
+
+    def parse_event_id(self, event_id: str | None) -> int | None:
+        """
+        Fetches the sequence number of an event id, if it came from this feed.
+        """
+        feed_id, _, seq = (event_id or "").partition(":")
+        if feed_id != self.feed_id or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        return int(seq)
+
+    def since(self, seq: int) -> list[tuple[int, dict]] | None:
+        """
+        Fetches the changes made after seq, or None if some have been dropped from the history.
+        """
+        if seq == self.seq:
+            return []
+        if not self._history or self._history[0][0] > seq + 1:
+            return None
+        return list(islice(self._history, seq + 1 - self._history[0][0], None))
+
+    async def wait(self, timeout_secs: float) -> bool:
+        """
+        Waits for the next change, returning False if there was none before the timeout.
+        """
+        try:
+            await asyncio.wait_for(self._new_change.wait(), timeout_secs)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+change_feed = ChangeFeed()
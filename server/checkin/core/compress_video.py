@@ -1,52 +1,61 @@
 import ffmpeg
 import os
 
-from contextlib import contextmanager
 from django.core.files.storage import FileSystemStorage
 from django.core.files.uploadedfile import UploadedFile
 from checkin.core.errors import InvalidVideo
 
 storage = FileSystemStorage()
 
+COMPRESSION_ARGS = dict(
+    crf=28,  # Constant Rate Factor: 0 (lossless) to 51 (worst quality), 28 is a good balance
+    an=None,
+    sn=None,
+    loglevel="error",
+    vf="scale=-2:240",  # Reduce resolution to 240p (maintains aspect ratio)
+)
 
-@contextmanager
-def compress_video(video: UploadedFile):
+
+def transcode(input_path: str, output_path: str):
     """
-    Compresses a video file using FFmpeg by reducing its resolution and bitrate.
+    Runs FFmpeg on a video file, reducing its resolution and bitrate.
+    This blocks until FFmpeg exits, so don't call it directly on the event loop.
     """
-    temp_filename = storage.save(f"temp/{video.name}", video)
-    temp_path = os.path.join(storage.location, temp_filename)
+    try:
+        ffmpeg.input(input_path).output(output_path, **COMPRESSION_ARGS).run()
+    except:
+        raise InvalidVideo
 
-    output_filename = f"compressed/{os.path.splitext(video.name)[0]}_compressed.webm"
-    output_path = os.path.join(storage.location, output_filename)
 
+def stream_compress_video(video: UploadedFile, output_name: str) -> str:
+    """
+    Compresses an uploaded video without any temp files: the upload's chunks are piped
+    into FFmpeg's stdin, and FFmpeg writes straight to the video's final place in storage.
+    Returns the name the video was stored under.
+    This blocks until FFmpeg exits, so don't call it directly on the event loop.
+    """
+    output_name = storage.get_available_name(output_name)
+    output_path = storage.path(output_name)
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
     try:
-        (
-            ffmpeg.input(temp_path)
-            .output(
-                output_path,
-                crf=28,  # Constant Rate Factor: 0 (lossless) to 51 (worst quality), 28 is a good balance
-                an=None,
-                sn=None,
-                loglevel="error",
-                vf="scale=-2:240",  # Reduce resolution to 240p (maintains aspect ratio)
-            )
-            .run()
+        process = (
+            ffmpeg.input("pipe:")
+            .output(output_path, **COMPRESSION_ARGS)
+            .run_async(pipe_stdin=True)
         )
     except:
         raise InvalidVideo
-
-    output_file = open(output_path, "rb")
-    django_file_obj = UploadedFile(
-        output_file, name=output_filename, content_type="video/webm"
-    )
-
     try:
-        yield django_file_obj
+        for chunk in video.chunks():
+            process.stdin.write(chunk)
+    except BrokenPipeError:
+        pass  # FFmpeg gave up on the input early; its exit code tells us why.
     finally:
-        output_file.close()
-        os.remove(temp_path)
-        os.remove(output_path)
+        process.stdin.close()
+    if process.wait() != 0:
+        storage.delete(output_name)
+        raise InvalidVideo
+    return output_name
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+import asyncio
+import time
+
+from checkin.core.get_now import get_now
+from checkin.core.shared_state import shared_state
+
+# How often each cache checks whether another process has changed it.
+VERSION_CHECK_SECS = 1
+
+
+class DailyCache:
+    """
+    Base class for process-local caches of data that the daily reset rewrites.
+    The data is loaded lazily, then reloaded when the day changes, when invalidate() is called,
+    or within VERSION_CHECK_SECS of another process (like the daily reset) calling ainvalidate().
+    Subclasses can also pick up smaller changes in place, as often, with _catch_up().
+    max_age_secs bounds how stale it can get otherwise.
+    """
+
+    def __init__(self, name: str, max_age_secs: float = 300):
+        self.name = name
+        self.max_age_secs = max_age_secs
+        self._loaded_at: float | None = None
+        self._loaded_day = None
+        self._loaded_version = 0
+        self._version_checked_at = 0.0
+        self._generation = 0
+        self._lock = asyncio.Lock()
+
+    def invalidate(self):
+        """
+        Marks the cached data as stale; the next read reloads it.
+        """
+        self._generation += 1
+        self._loaded_at = None
+
+    async def ainvalidate(self):
+        """
+        Marks the cached data as stale in every process.
+        """
+        self.invalidate()
+        await shared_state.bump_cache_version(self.name)
+
+    def is_fresh(self) -> bool:
+        return (
+            self._loaded_at is not None
+            and self._loaded_day == get_now().date()
+            and time.monotonic() - self._loaded_at < self.max_age_secs
+        )
+
+    async def ensure_loaded(self):
+        if self.is_fresh() and not await self._changed_elsewhere():
+            return
+        async with self._lock:
+            if self.is_fresh():
+                return
+            generation = self._generation
+            version = await shared_state.cache_version(self.name)
+            await self._load()
+            # If invalidate() was called mid-load, the data we just read may already be stale.
+            if generation == self._generation:
+                self._loaded_at = time.monotonic()
+                self._loaded_day = get_now().date()
+                self._loaded_version = version
+
+    async def _changed_elsewhere(self) -> bool:
+        now = time.monotonic()
+        if now - self._version_checked_at < VERSION_CHECK_SECS:
+            return False
+        self._version_checked_at = now
+        if await shared_state.cache_version(self.name) == self._loaded_version:
+            await self._catch_up()
+            return False
+        self.invalidate()
+        return True
+
+    async def _catch_up(self):
+        """
+        Applies changes made since the data was loaded, without reloading it all.
+        """
+        pass
+
+    async def _load(self):
+        raise NotImplementedError
@@ -81,3 +81,8 @@ class NoSeniorPrivileges(Http400):
             "You don't have senior privileges."
             " If you're a senior, you probably forgot to do the form.",
         )
+
+
+class InvalidCursor(Http400):
+    def __init__(self):
+        super().__init__(11, "Invalid page cursor.")
@@ -0,0 +1,54 @@
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from checkin.core.consts import FreeBlock
+from checkin.core.daily_cache import DailyCache
+from checkin.models import FreeBlockToday
+
+
+class FreeBlockSchedule(DailyCache):
+    """
+    A sorted interval index of today's FreeBlockToday rows,
+    so that the current and next free block can be found with a bisect instead of a db scan.
+    Free blocks never overlap, so the only candidate for the current block
+    is the last one that has started.
+    """
+
+    def __init__(self):
+        super().__init__("free_block_schedule")
+        self._starts: list[datetime] = []
+        self._blocks: list[FreeBlockToday] = []
+
+    async def _load(self):
+        blocks = [b async for b in FreeBlockToday.objects.order_by("start")]
+        self._starts, self._blocks = [b.start for b in blocks], blocks
+
+    async def current(self, now: datetime) -> FreeBlock | None:
+        """
+        Fetches the free block that is active at the given time, if any.
+        """
+        await self.ensure_loaded()
+        idx = bisect_left(self._starts, now) - 1
+        if idx >= 0 and now < self._blocks[idx].end:
+            return self._blocks[idx].block
+        return None
+
+    async def next(self, now: datetime) -> FreeBlockToday | None:
+        """
+        Fetches the first free block that starts after the given time, if any.
+        """
+        await self.ensure_loaded()
+        idx = bisect_right(self._starts, now)
+        return self._blocks[idx] if idx < len(self._blocks) else None
+
+
+free_block_schedule = FreeBlockSchedule()
+
+
+@receiver(post_save, sender=FreeBlockToday)
+@receiver(post_delete, sender=FreeBlockToday)
+def invalidate_free_block_schedule(sender, **kwargs):
+    free_block_schedule.invalidate()
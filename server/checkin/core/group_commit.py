@@ -0,0 +1,96 @@
+import asyncio
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, models, transaction, DatabaseError, IntegrityError
+
+from config import settings
+
+
+class GroupCommitWriter:
+    """
+    Saves check-in records that arrive within window_ms of each other in one transaction,
+    so that a burst of check-ins pays for one commit instead of one each.
+    Every record is saved in its own savepoint, so a record that breaks a constraint
+    only fails its own save() (with the IntegrityError asave() would have raised),
+    while the rest of the batch is still committed.
+    """
+
+    def __init__(self, window_ms: float, max_batch_size: int = 100):
+        self.window_secs = window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending: list[tuple[models.Model, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._commits: set[asyncio.Task] = set()
+        # All batches are written from one thread (and so one connection), one at a time.
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="group-commit")
+
+    async def save(self, model: models.Model):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((model, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif len(self._pending) == 1:
+            self._timer = asyncio.get_running_loop().call_later(
+                self.window_secs, self._flush
+            )
+        await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        task = asyncio.create_task(self._commit(batch))
+        self._commits.add(task)
+        task.add_done_callback(self._commits.discard)
+
+    async def _commit(self, batch: list[tuple[models.Model, asyncio.Future]]):
+        try:
+            errors = await asyncio.get_running_loop().run_in_executor(
+                self._executor, _save_all, [model for model, _ in batch]
+            )
+        except Exception as ex:
+            errors = [ex] * len(batch)
+        for (_, future), error in zip(batch, errors):
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(None)
+            else:
+                future.set_exception(error)
+
+
+def _save_all(batch: list[models.Model]) -> list[IntegrityError | None]:
+    errors = []
+    try:
+        with transaction.atomic():
+            for model in batch:
+                try:
+                    with transaction.atomic():
+                        model.save()
+                    errors.append(None)
+                except IntegrityError as ex:
+                    errors.append(ex)
+    except DatabaseError:
+        # Starts the next batch on a fresh connection, in case this one broke.
+        connection.close()
+        raise
+    return errors
+
+
+group_commit = (
+    GroupCommitWriter(settings.GROUP_COMMIT_WINDOW_MS)
+    if settings.GROUP_COMMIT_WINDOW_MS
+    else None
+)
+
+
+async def save_check_in(model: models.Model):
+    """
+    Saves a check-in record, through the group commit writer if it's enabled.
+    """
+    if group_commit is None:
+        await model.asave()
+    else:
+        await group_commit.save(model)
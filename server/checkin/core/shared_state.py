@@ -0,0 +1,224 @@
+"""
+State that every server process needs to agree on: the kiosk token, issued user tokens,
+the versions of the in-process caches (so a change made by one process
+makes the others reload), and the daily reset's scheduler status.
+With one server process, tokens are kept in memory; with several, set SHARED_STATE_BACKEND=database.
+Cache versions and the scheduler status are always kept in the database.
+"""
+
+import json
+import time
+import uuid
+
+from datetime import datetime, timezone
+
+from django.db import IntegrityError
+from django.db.models import F
+
+from checkin.core.random_token_manager import RandomTokenManager
+from checkin.core.token_store import ExpiringTokenStore
+from checkin.models import SharedToken, SharedValue
+from config import settings
+
+KIOSK_TOKEN_INTERVAL_SECS = 5
+# Students get a few minutes (60 kiosk token rotations) to check in after scanning.
+USER_TOKEN_TTL_SECS = KIOSK_TOKEN_INTERVAL_SECS * 60
+
+
+class CacheVersions:
+    """
+    The versions of the in-process caches and the daily reset's scheduler status,
+    stored in the database with either backend, since the daily reset is a separate process.
+    """
+
+    async def cache_version(self, name: str) -> int:
+        version = (
+            await SharedValue.objects.filter(key=f"cache:{name}")
+            .values_list("version", flat=True)
+            .afirst()
+        )
+        return version or 0
+
+    async def bump_cache_version(self, name: str) -> int:
+        """
+        Marks a cache as changed, returning its new version.
+        """
+        key = f"cache:{name}"
+        now = datetime.now(timezone.utc)
+        num_updated = await SharedValue.objects.filter(key=key).aupdate(
+            version=F("version") + 1, updated_at=now
+        )
+        if not num_updated:
+            try:
+                await SharedValue.objects.acreate(key=key, version=1, updated_at=now)
+            except IntegrityError:
+                return await self.bump_cache_version(name)
+        return await self.cache_version(name)
+
+    async def report_scheduler_status(self, pending_jobs: int):
+        """
+        Records how many jobs the daily reset has scheduled, so that the server can report it.
+        """
+        await SharedValue.objects.aupdate_or_create(
+            key="scheduler:pending",
+            defaults={
+                "version": pending_jobs,
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+
+    async def scheduler_status(self) -> SharedValue | None:
+        """
+        The last scheduler status reported (its version is the number of pending jobs),
+        or None if the daily reset never reported one.
+        """
+        return await SharedValue.objects.filter(key="scheduler:pending").afirst()
+
+
+class LocalState(CacheVersions):
+    """
+    Shared state for a single server process.
+    """
+
+    def __init__(self):
+        self._kiosk_tokens = RandomTokenManager(KIOSK_TOKEN_INTERVAL_SECS)
+        self._user_tokens = ExpiringTokenStore(USER_TOKEN_TTL_SECS, max_size=20_000)
+        self._used_nonces = ExpiringTokenStore(USER_TOKEN_TTL_SECS, max_size=20_000)
+
+    async def kiosk_token(self) -> dict:
+        """
+        Fetches the current kiosk token and the secs until it rotates.
+        """
+        return self._kiosk_tokens.get()
+
+    async def is_valid_kiosk_token(self, token: str) -> bool:
+        return self._kiosk_tokens.validate(token)
+
+    async def issue_user_token(self) -> str:
+        token = str(uuid.uuid4())
+        self._user_tokens.add(token)
+        return token
+
+    async def consume_user_token(self, token: str) -> float | None:
+        """
+        Removes a user token, returning when it would've expired (as a time.time() time),
+        or None if it wasn't valid.
+        """
+        expires_at = self._user_tokens.pop(token)
+        if expires_at is None:
+            return None
+        return time.time() + expires_at - time.monotonic()
+
+    async def restore_user_token(self, token: str, expires_at: float):
+        """
+        Makes a consumed token usable again, until it would've expired.
+        """
+        self._user_tokens.add(token, time.monotonic() + expires_at - time.time())
+
+    async def mark_nonce_used(self, nonce: str, expires_at: float) -> bool:
+        """
+        Remembers a signed token's nonce until expires_at (a time.time() time),
+        returning False if it was already used.
+        """
+        if nonce in self._used_nonces:
+            return False
+        self._used_nonces.add(nonce, time.monotonic() + expires_at - time.time())
+        return True
+
+    async def unmark_nonce_used(self, nonce: str):
+        self._used_nonces.consume(nonce)
+
+
+class DatabaseState(CacheVersions):
+    """
+    Shared state stored in the database, so that any number of server processes can share it.
+    """
+
+    KIOSK_TOKEN_KEY = "kiosk_token"
+
+    def __init__(self):
+        self._num_added = 0
+
+    async def kiosk_token(self) -> dict:
+        now = datetime.now(timezone.utc)
+        row = await self._kiosk_token_row()
+        tokens = json.loads(row.value)
+        age_secs = (now - row.updated_at).total_seconds()
+        if 0 <= age_secs <= KIOSK_TOKEN_INTERVAL_SECS:
+            return {
+                "token": tokens["curr"],
+                "time_until_refresh": KIOSK_TOKEN_INTERVAL_SECS - age_secs,
+            }
+        new_tokens = {"curr": str(uuid.uuid4()), "prev": tokens["curr"]}
+        # If another process rotated the token first, its token is used instead.
+        num_updated = await SharedValue.objects.filter(
+            key=self.KIOSK_TOKEN_KEY, version=row.version
+        ).aupdate(
+            value=json.dumps(new_tokens), version=F("version") + 1, updated_at=now
+        )
+        if not num_updated:
+            return await self.kiosk_token()
+        return {
+            "token": new_tokens["curr"],
+            "time_until_refresh": KIOSK_TOKEN_INTERVAL_SECS,
+        }
+
+    async def is_valid_kiosk_token(self, token: str) -> bool:
+        tokens = json.loads((await self._kiosk_token_row()).value)
+        return token in (tokens["curr"], tokens["prev"])
+
+    async def issue_user_token(self) -> str:
+        token = str(uuid.uuid4())
+        await self.restore_user_token(token, time.time() + USER_TOKEN_TTL_SECS)
+        return token
+
+    async def restore_user_token(self, token: str, expires_at: float):
+        """
+        Stores a user token until expires_at (a time.time() time).
+        """
+        # A plain insert; update_or_create()'s read-then-write transaction
+        # can fail with "database is locked" on SQLite under load.
+        await SharedToken.objects.acreate(
+            token=token, expires_at=datetime.fromtimestamp(expires_at, timezone.utc)
+        )
+        self._num_added += 1
+        if self._num_added % 500 == 0:
+            await SharedToken.objects.filter(
+                expires_at__lte=datetime.now(timezone.utc)
+            ).adelete()
+
+    async def consume_user_token(self, token: str) -> float | None:
+        tokens = SharedToken.objects.filter(token=token)
+        row = await tokens.filter(expires_at__gt=datetime.now(timezone.utc)).afirst()
+        if row is None:
+            return None
+        # Deleting is atomic, so only one process can consume a token.
+        num_deleted, _ = await tokens.adelete()
+        return row.expires_at.timestamp() if num_deleted else None
+
+    async def mark_nonce_used(self, nonce: str, expires_at: float) -> bool:
+        # Stored with the user tokens, under a prefix that a uuid can't start with.
+        try:
+            await self.restore_user_token(f"nonce:{nonce}", expires_at)
+        except IntegrityError:
+            return False
+        return True
+
+    async def unmark_nonce_used(self, nonce: str):
+        await SharedToken.objects.filter(token=f"nonce:{nonce}").adelete()
+
+    async def _kiosk_token_row(self) -> SharedValue:
+        token = str(uuid.uuid4())
+        row, _ = await SharedValue.objects.aget_or_create(
+            key=self.KIOSK_TOKEN_KEY,
+            defaults={
+                "value": json.dumps({"curr": token, "prev": token}),
+                "updated_at": datetime.now(timezone.utc),
+            },
+        )
+        return row
+
+
+shared_state = (
+    DatabaseState() if settings.SHARED_STATE_BACKEND == "database" else LocalState()
+)
@@ -0,0 +1,83 @@
+import secrets
+import time
+
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from checkin.core.shared_state import (
+    KIOSK_TOKEN_INTERVAL_SECS,
+    USER_TOKEN_TTL_SECS,
+    shared_state,
+)
+
+
+class SignedTokens:
+    """
+    Kiosk and user tokens that are validated with SECRET_KEY instead of stored state,
+    so any server process (or one that just restarted) can validate them.
+
+    Kiosk tokens are derived from the current time window, TOTP-style;
+    the previous window's token is still accepted, like with RandomTokenManager.
+    User tokens are a random nonce signed with the time they were issued.
+    Used nonces are remembered by the shared state backend until they expire,
+    so a token can't be used twice, even on different processes.
+    """
+
+    KIOSK_SALT = "checkin.kiosk_token"
+    USER_SALT = "checkin.user_token"
+
+    def __init__(self, interval_secs: float, ttl_secs: float):
+        self.interval_secs = interval_secs
+        self.ttl_secs = ttl_secs
+        self._signer = signing.TimestampSigner(salt=self.USER_SALT)
+
+    async def kiosk_token(self) -> dict:
+        now = time.time()
+        window = int(now // self.interval_secs)
+        return {
+            "token": self._kiosk_token_of(window),
+            "time_until_refresh": (window + 1) * self.interval_secs - now,
+        }
+
+    async def is_valid_kiosk_token(self, token: str) -> bool:
+        window = int(time.time() // self.interval_secs)
+        return any(
+            constant_time_compare(token, self._kiosk_token_of(w))
+            for w in (window, window - 1)
+        )
+
+    async def issue_user_token(self) -> str:
+        return self._signer.sign(secrets.token_urlsafe(12))
+
+    async def consume_user_token(self, token: str) -> float | None:
+        """
+        Marks a user token as used, returning when it expires (as a time.time() time),
+        or None if it wasn't valid.
+        """
+        try:
+            nonce = self._signer.unsign(token, max_age=self.ttl_secs)
+        except signing.BadSignature:
+            return None
+        issued_at = signing.b62_decode(token.rsplit(self._signer.sep, 2)[1])
+        expires_at = issued_at + self.ttl_secs
+        if not await shared_state.mark_nonce_used(nonce, expires_at):
+            return None
+        return expires_at
+
+    async def restore_user_token(self, token: str, expires_at: float):
+        """
+        Makes a consumed token usable again; it still expires ttl_secs after it was issued.
+        """
+        try:
+            nonce = self._signer.unsign(token)
+        except signing.BadSignature:
+            return
+        await shared_state.unmark_nonce_used(nonce)
+
+    def _kiosk_token_of(self, window: int) -> str:
+        return salted_hmac(
+            self.KIOSK_SALT, str(window), algorithm="sha256"
+        ).hexdigest()[:32]
+
+
+signed_tokens = SignedTokens(KIOSK_TOKEN_INTERVAL_SECS, USER_TOKEN_TTL_SECS)
@@ -0,0 +1,40 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from checkin.core.consts import EVERYONE_KW
+from checkin.core.daily_cache import DailyCache
+from checkin.models import SeniorPrivilegesBan
+
+
+class SpBans(DailyCache):
+    """
+    The set of students banned from senior privileges, so that check-ins and
+    /allSeniors/ can look bans up in O(1) without a query.
+    Bans only change through /enableSp/, /disableSp/ and the admin site,
+    which all invalidate this cache.
+    """
+
+    def __init__(self):
+        super().__init__("sp_bans")
+        self._emails: frozenset[str] = frozenset()
+        self._everyone = False
+
+    async def _load(self):
+        emails = {ban.is_for async for ban in SeniorPrivilegesBan.objects.all()}
+        self._emails, self._everyone = frozenset(emails), EVERYONE_KW in emails
+
+    async def applies_to(self, email: str) -> bool:
+        """
+        Whether a student is banned, either directly or through the "everyone" ban.
+        """
+        await self.ensure_loaded()
+        return self._everyone or email in self._emails
+
+
+sp_bans = SpBans()
+
+
+@receiver(post_save, sender=SeniorPrivilegesBan)
+@receiver(post_delete, sender=SeniorPrivilegesBan)
+def invalidate_sp_bans(sender, **kwargs):
+    sp_bans.invalidate()
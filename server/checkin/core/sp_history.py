@@ -0,0 +1,113 @@
+"""
+Keyset pagination and streaming exports of senior privileges records,
+so that listing a whole semester doesn't load every record into memory at once.
+"""
+
+import csv
+import json
+
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from django.db.models import Q, QuerySet
+
+from checkin.core.consts import US_EASTERN
+from checkin.core.errors import InvalidCursor
+from checkin.models import SeniorPrivilegeCheckIn
+
+PAGE_SIZE = 500
+CSV_COLUMNS = ("name", "email", "status", "date_str")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+Cursor = tuple[datetime, int]
+
+
+def sp_records(
+    from_date: datetime | None, to_date: datetime | None
+) -> QuerySet[SeniorPrivilegeCheckIn]:
+    """
+    Fetches the records checked out within a date range, or today if there's no range,
+    in keyset (check_out_date, id) order.
+    """
+    records = SeniorPrivilegeCheckIn.objects.select_related("student")
+    if from_date:
+        records = records.filter(check_out_date__gte=from_date)
+    if to_date:
+        records = records.filter(check_out_date__lte=to_date)
+    if not from_date and not to_date:
+        records = records.filter(check_out_day=datetime.now(US_EASTERN).date())
+    return records.order_by("check_out_date", "id")
+
+
+def encode_cursor(record: SeniorPrivilegeCheckIn) -> str:
+    micros = (record.check_out_date - _EPOCH) // timedelta(microseconds=1)
+    return f"{micros}-{record.id}"
+
+
+def decode_cursor(cursor: str) -> Cursor:
+    micros, _, pk = cursor.partition("-")
+    if not micros.isdigit() or not pk.isdigit():
+        raise InvalidCursor
+    return _EPOCH + timedelta(microseconds=int(micros)), int(pk)
+
+
+async def sp_page(
+    records: QuerySet[SeniorPrivilegeCheckIn], after: Cursor | None, limit: int
+) -> tuple[list[SeniorPrivilegeCheckIn], str | None]:
+    """
+    Fetches up to limit records after the cursor,
+    along with the cursor of the next page (or None if this is the last one).
+    """
+    if not 1 <= limit <= PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {PAGE_SIZE}")
+    page = [r async for r in records_after(records, after)[:limit]]
+    return page, encode_cursor(page[-1]) if len(page) == limit else None
+
+
+async def iter_sp_records(
+    records: QuerySet[SeniorPrivilegeCheckIn], after: Cursor | None = None
+) -> AsyncIterator[SeniorPrivilegeCheckIn]:
+    """
+    Iterates over every record after the cursor, holding one page in memory at a time.
+    """
+    while True:
+        page = [r async for r in records_after(records, after)[:PAGE_SIZE]]
+        for record in page:
+            yield record
+        if len(page) < PAGE_SIZE:
+            return
+        after = (page[-1].check_out_date, page[-1].id)
+
+
+async def ndjson_lines(records: AsyncIterator[SeniorPrivilegeCheckIn]):
+    async for record in records:
+        yield json.dumps(record.dict()) + "\n"
+
+
+async def csv_lines(records: AsyncIterator[SeniorPrivilegeCheckIn]):
+    writer = csv.DictWriter(_Echo(), CSV_COLUMNS)
+    yield writer.writeheader()
+    async for record in records:
+        yield writer.writerow(record.dict())
+
+
+class _Echo:
+    """
+    A file-like object that hands each written row back to the csv writer's caller.
+    """
+
+    def write(self, value: str):
+        return value
+
+
+def records_after(records: QuerySet[SeniorPrivilegeCheckIn], after: Cursor | None):
+    """
+    Narrows keyset-ordered records down to the ones after the cursor.
+    """
+    if after is None:
+        return records
+    date, pk = after
+    return records.filter(
+        Q(check_out_date__gt=date) | Q(check_out_date=date, id__gt=pk)
+    )
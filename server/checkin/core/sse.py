@@ -0,0 +1,33 @@
+import json
+
+from typing import AsyncIterator
+
+from django.http import StreamingHttpResponse
+
+# Comment lines are ignored by EventSource, but stop proxies (ie. ngrok) from
+# closing the connection while nothing is being sent.
+KEEP_ALIVE = ": keep-alive\n\n"
+KEEP_ALIVE_SECS = 15
+
+
+def sse_event(data, event: str | None = None, event_id: str | int | None = None) -> str:
+    """
+    Formats a server-sent event, with data serialized as json.
+    """
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    if event is not None:
+        lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def sse_response(events: AsyncIterator[str]) -> StreamingHttpResponse:
+    """
+    Streams server-sent events to the client, until it disconnects.
+    """
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+from checkin.core.daily_cache import DailyCache
+from checkin.models import Student
+
+
+class StudentIds(DailyCache):
+    """
+    An index of Blackbaud user IDs to student emails, filled in by the daily reset,
+    so that students checking in with their ID don't need a Blackbaud request.
+    """
+
+    def __init__(self):
+        super().__init__("student_ids")
+        self._emails: dict[int, str] = {}
+
+    async def _load(self):
+        self._emails = {
+            bb_id: email
+            async for bb_id, email in Student.objects.exclude(bb_id=None).values_list(
+                "bb_id", "email"
+            )
+        }
+
+    async def email_of(self, bb_id: int) -> str | None:
+        await self.ensure_loaded()
+        return self._emails.get(bb_id)
+
+
+class LruTtlCache:
+    """
+    A bounded map whose entries expire after ttl_secs;
+    once max_size is reached, the least recently used entries are dropped.
+    """
+
+    def __init__(self, ttl_secs: float, max_size: int):
+        self.ttl_secs = ttl_secs
+        self.max_size = max_size
+        self._entries: OrderedDict[object, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            expiry, value = self._entries.get(key, (0, None))
+            if expiry <= time.monotonic():
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = time.monotonic() + self.ttl_secs, value
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+student_ids = StudentIds()
+# Emails that Blackbaud resolved for IDs missing from the index (ex. students added mid-day).
+fetched_emails = LruTtlCache(ttl_secs=6 * 60 * 60, max_size=1000)
@@ -0,0 +1,89 @@
+import asyncio
+import heapq
+import itertools
+import logging
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Awaitable, Callable
+
+logger = logging.getLogger(__name__)
+
+# The longest the scheduler sleeps before re-checking the clock,
+# so that it can't oversleep if the system clock jumps (ex. after a suspend).
+MAX_SLEEP_SECS = 60
+
+
+@dataclass
+class Job:
+    fire_at: datetime
+    key: str
+    func: Callable[..., Awaitable]
+    args: tuple
+    cancelled: bool = field(default=False)
+
+
+class TimerScheduler:
+    """
+    Runs async jobs at exact times, sleeping until the next one is due.
+    Jobs are kept in a heap ordered by fire time, and are identified by a key;
+    scheduling a job under an existing key replaces it.
+    """
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, int, Job]] = []
+        self._jobs: dict[str, Job] = {}
+        self._counter = itertools.count()
+        self._wake = asyncio.Event()
+        self._tasks: set[asyncio.Task] = set()
+
+    def call_at(
+        self, fire_at: datetime, key: str, func: Callable[..., Awaitable], *args
+    ):
+        """
+        Schedules func(*args) to be awaited at fire_at, a timezone-aware datetime.
+        """
+        self.cancel(key)
+        job = Job(fire_at, key, func, args)
+        self._jobs[key] = job
+        heapq.heappush(self._heap, (fire_at, next(self._counter), job))
+        self._wake.set()
+
+    def cancel(self, key: str):
+        job = self._jobs.pop(key, None)
+        if job:
+            # It's skipped once it reaches the top of the heap.
+            job.cancelled = True
+
+    def pending(self) -> int:
+        return len(self._jobs)
+
+    async def run(self):
+        while True:
+            self._wake.clear()
+            now = datetime.now(timezone.utc)
+            while self._heap and (
+                self._heap[0][2].cancelled or self._heap[0][0] <= now
+            ):
+                _, _, job = heapq.heappop(self._heap)
+                if not job.cancelled:
+                    del self._jobs[job.key]
+                    self._start(job)
+            sleep_secs = MAX_SLEEP_SECS
+            if self._heap:
+                sleep_secs = min(sleep_secs, (self._heap[0][0] - now).total_seconds())
+            try:
+                await asyncio.wait_for(self._wake.wait(), sleep_secs)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, job: Job):
+        task = asyncio.create_task(job.func(*job.args))
+        # Keeps a reference, so the task isn't garbage collected mid-run.
+        self._tasks.add(task)
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            logger.error("Scheduled job failed", exc_info=task.exception())
@@ -0,0 +1,65 @@
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class ExpiringTokenStore:
+    """
+    A bounded set of single-use tokens that expire after ttl_secs.
+    Insert, lookup and consume are all O(1); since every token gets the same ttl,
+    insertion order is expiry order, so stale tokens are lazily evicted from the front.
+    Once max_size is reached, the oldest tokens are dropped to make room.
+    """
+
+    def __init__(self, ttl_secs: float, max_size: int):
+        self.ttl_secs = ttl_secs
+        self.max_size = max_size
+        self._expiries: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, token: str, expires_at: float | None = None):
+        """
+        Stores a token, (re)starting its ttl, or until expires_at (a time.monotonic() time).
+        A token added with an earlier expiry than the ones before it is evicted late,
+        but still can't be consumed after it expires.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            self._expiries.pop(token, None)
+            self._expiries[token] = (
+                now + self.ttl_secs if expires_at is None else expires_at
+            )
+            while len(self._expiries) > self.max_size:
+                self._expiries.popitem(last=False)
+
+    def __contains__(self, token: str):
+        expiry = self._expiries.get(token)
+        return expiry is not None and expiry > time.monotonic()
+
+    def consume(self, token: str) -> bool:
+        """
+        Atomically removes a token, returning whether it was present and unexpired.
+        """
+        return self.pop(token) is not None
+
+    def pop(self, token: str) -> float | None:
+        """
+        Atomically removes a token, returning its expiry if it was present and unexpired.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            expires_at = self._expiries.pop(token, 0)
+            return expires_at if expires_at > now else None
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def _evict(self, now: float):
+        while self._expiries:
+            token, expiry = next(iter(self._expiries.items()))
+            if expiry > now:
+                break
+            del self._expiries[token]
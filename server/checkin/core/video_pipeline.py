@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.db import models
+
+from checkin.core.compress_video import storage, transcode
+from config import settings
+from config.metrics import timed
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VideoJob:
+    model_cls: type[models.Model]
+    pk: int
+    raw_name: str
+
+
+class VideoCompressionPool:
+    """
+    Compresses uploaded check-in videos in the background.
+    (Or, with run(), in the foreground, while sharing the same concurrency limit.)
+    Jobs wait in a bounded queue, and at most num_workers FFmpeg processes run at once
+    (driven from a thread pool, so the event loop never blocks on them).
+    Once a video is compressed, it replaces the raw upload on the job's record;
+    if compression fails, the raw upload is kept.
+    """
+
+    def __init__(self, num_workers: int, max_queue_size: int):
+        self.num_workers = num_workers
+        self.max_queue_size = max_queue_size
+        self.in_progress = 0
+        self.num_processed = 0
+        self.num_failed = 0
+        self.total_processing_secs = 0.0
+        self.last_processing_secs: float | None = None
+        self._queue: asyncio.Queue[VideoJob] | None = None
+        self._workers: list[asyncio.Task] = []
+        self._executor = ThreadPoolExecutor(num_workers, thread_name_prefix="ffmpeg")
+
+    async def submit(self, job: VideoJob):
+        """
+        Queues a job. If the queue is full, this waits until there is room.
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue(self.max_queue_size)
+            self._workers = [
+                asyncio.create_task(self._work()) for _ in range(self.num_workers)
+            ]
+        await self._queue.put(job)
+
+    def stats(self):
+        return {
+            "workers": self.num_workers,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "max_queue_size": self.max_queue_size,
+            "in_progress": self.in_progress,
+            "processed": self.num_processed,
+            "failed": self.num_failed,
+            "avg_processing_secs": (
+                self.total_processing_secs / (self.num_processed + self.num_failed)
+                if self.num_processed + self.num_failed
+                else None
+            ),
+            "last_processing_secs": self.last_processing_secs,
+        }
+
+    async def run(self, func, *args):
+        """
+        Runs a blocking FFmpeg call on the pool's threads (skipping the queue),
+        and waits for its result.
+        """
+        with self._track(), timed("ffmpeg"):
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, func, *args
+            )
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                with self._track():
+                    await self._process(job)
+            except Exception:
+                logger.exception(f"Couldn't compress {job.raw_name}, keeping it as is.")
+            finally:
+                self._queue.task_done()
+            logger.info(
+                f"Processed {job.raw_name} in {self.last_processing_secs:.2f} secs "
+                f"({self._queue.qsize()} videos queued)"
+            )
+
+    @contextmanager
+    def _track(self):
+        self.in_progress += 1
+        start = time.perf_counter()
+        try:
+            yield
+            self.num_processed += 1
+        except Exception:
+            self.num_failed += 1
+            raise
+        finally:
+            self.in_progress -= 1
+            self.last_processing_secs = time.perf_counter() - start
+            self.total_processing_secs += self.last_processing_secs
+
+    async def _process(self, job: VideoJob):
+        compressed_name = storage.get_available_name(
+            job.raw_name.replace("/raw/", "/", 1)
+        )
+        compressed_path = storage.path(compressed_name)
+        os.makedirs(os.path.dirname(compressed_path), exist_ok=True)
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._executor, transcode, storage.path(job.raw_name), compressed_path
+            )
+        except:
+            # FFmpeg may have written part of the video before failing.
+            storage.delete(compressed_name)
+            raise
+        # Only swap the video if the record still points at this upload;
+        # it may have been deleted (or re-uploaded) while we were compressing.
+        num_updated = await job.model_cls.objects.filter(
+            pk=job.pk, video=job.raw_name
+        ).aupdate(video=compressed_name)
+        storage.delete(job.raw_name if num_updated else compressed_name)
+
+
+video_pool = VideoCompressionPool(
+    num_workers=settings.VIDEO_COMPRESSION_WORKERS,
+    max_queue_size=settings.VIDEO_COMPRESSION_QUEUE_SIZE,
+)
@@ -0,0 +1,77 @@
+from datetime import datetime, timedelta
+
+from django.core.management import BaseCommand, CommandError
+from django.db import connection
+
+from checkin.api import student_video_query
+from checkin.core.api_methods import student_for_check_in
+from checkin.core.block_rosters import check_ins_after, roster_students
+from checkin.core.consts import US_EASTERN
+from checkin.core.sp_history import sp_records, records_after, PAGE_SIZE
+from checkin.models import FreePeriodCheckIn
+
+EMAIL = "student@caryacademy.org"
+
+# Queries that are expected to read a whole table, and the table they read.
+# The rosters are loaded from every student with a free block, which is most of them.
+EXPECTED_SCANS = {"/students/{free_block}/ (roster load)": "checkin_student"}
+
+
+def _hot_queries():
+    now = datetime.now(US_EASTERN)
+    last_month = now - timedelta(days=30)
+    return {
+        "/run/ (student + today's SP record)": student_for_check_in(EMAIL),
+        "/spStudents/ (today)": sp_records(None, None),
+        "/spStudents/ (date range)": sp_records(last_month, now),
+        "/spStudents/ (next page)": records_after(
+            sp_records(last_month, now), (last_month, 1)
+        )[:PAGE_SIZE],
+        "/studentVid/": student_video_query("A", EMAIL),
+        "/students/{free_block}/ (roster load)": roster_students(),
+        # What prefetch_related("fp_records") runs for the loaded students.
+        "/students/{free_block}/ (roster load, check-ins)": (
+            FreePeriodCheckIn.objects.filter(student__in=[EMAIL])
+        ),
+        "/students/{free_block}/ (catch up)": check_ins_after(0),
+    }
+
+
+def _full_scans(plan: str, expected_table: str | None = None):
+    """
+    Finds the steps of an EXPLAIN QUERY PLAN that read a whole table without an index
+    (other than expected_table).
+    """
+    return [
+        line
+        for line in plan.splitlines()
+        if "SCAN " in line
+        and "USING " not in line
+        and "CONSTANT ROW" not in line
+        and not (expected_table and f"SCAN {expected_table}" in line)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs SQLite's EXPLAIN QUERY PLAN on the hot check-in queries, "
+        "and fails if any of them scans a whole table instead of using an index."
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("Query plans can only be checked on SQLite.")
+        failed = []
+        for name, queryset in _hot_queries().items():
+            plan = queryset.explain()
+            scans = _full_scans(plan, EXPECTED_SCANS.get(name))
+            if scans:
+                failed.append(name)
+                self.stdout.write(self.style.ERROR(f"{name}: full table scan"))
+            elif "TEMP B-TREE" in plan:
+                self.stdout.write(self.style.WARNING(f"{name}: sorts without an index"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{name}: OK"))
+            self.stdout.write(plan + "\n")
+        if failed:
+            raise CommandError(f"Queries without a usable index: {', '.join(failed)}")
@@ -1,20 +1,30 @@
 import asyncio
 import logging
 import os
-import schedule
 
+from asgiref.sync import sync_to_async
 from django.core.management import BaseCommand
-from pywebpush import webpush, WebPushException
+from django.db import transaction
+from checkin.core.block_rosters import block_rosters
+from checkin.core.free_block_schedule import free_block_schedule
 from checkin.core.get_now import get_now
+from checkin.core.shared_state import shared_state
+from checkin.core.sqlite_tuning import checkpoint_wal
+from checkin.core.student_ids import student_ids
+from checkin.core.timer_scheduler import TimerScheduler
 from checkin.core.consts import ALL_FREE_BLOCKS, FreeBlock
 from checkin.models import Student, FreeBlockToday, FreePeriodCheckIn
 from datetime import datetime, time, timedelta, timezone
+from typing import Iterable
 from dotenv import load_dotenv
-from notifs.models import SubscriptionData
+from notifs.reminders import remind_free_block
 
 logger = logging.getLogger(__name__)
 load_dotenv()
 
+WAL_CHECKPOINT_INTERVAL = timedelta(minutes=5)
+STATUS_REPORT_INTERVAL = timedelta(minutes=1)
+
 US_LEVEL = os.environ["UPPER_SCHOOL_LEVEL_NUM"]
 STUDENTS_ROLE = os.environ["STUDENTS_ROLE_NUM"]
 SCHED_SET_ID = os.environ["SCHEDULE_SET_ID"]
@@ -22,12 +32,14 @@ print(f"Upper School level number: {US_LEVEL};")
 print(f"Students Role Num: {STUDENTS_ROLE};")
 print(f"Schedule Set ID: {SCHED_SET_ID}")
 
+
 class Command(BaseCommand):
     help = "When run, periodically resets the database data at a certain time(7:00 by default) every day"
 
     def __init__(self):
         super().__init__()
         self.free_blocks_today: dict[FreeBlock, FreeBlockToday] = {}
+        self.scheduler = TimerScheduler()
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -37,6 +49,18 @@ class Command(BaseCommand):
             default="07:00",
             nargs="?",
         )
+        parser.add_argument(
+            "-fullReset",
+            action="store_true",
+            help="If true, deletes every student before re-adding them,"
+            " instead of only applying the changes.",
+        )
+        parser.add_argument(
+            "-replay",
+            action="store_true",
+            help="If true, the initial reset uses the last cached Blackbaud responses"
+            " instead of fetching them (ex. when Blackbaud is down).",
+        )
         parser.add_argument(
             "-dontRunInitial",
             action="store_true",
@@ -45,58 +69,108 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         try:
-            asyncio.run(self.main(options["time"], options["dontRunInitial"]))
+            asyncio.run(
+                self.main(
+                    options["time"],
+                    options["dontRunInitial"],
+                    options["fullReset"],
+                    options["replay"],
+                )
+            )
         except KeyboardInterrupt:
             return
 
-    async def main(self, scheduled_time: str, dont_run_initial: bool):
+    async def main(
+        self,
+        scheduled_time: str,
+        dont_run_initial: bool,
+        full_reset: bool,
+        replay: bool,
+    ):
         logger.info("Daily reset task started.")
         if not dont_run_initial:
-            await self.daily_reset(True)
-        schedule.every().day.at(scheduled_time).do(
-            lambda: asyncio.create_task(self.daily_reset(True))
+            await self.daily_reset(True, full_reset, replay)
+        else:
+            # Picks up today's reminders from the last reset, ex. after a restart.
+            self._schedule_reminders(
+                [free_block async for free_block in FreeBlockToday.objects.all()]
+            )
+        self._schedule_daily_reset(scheduled_time, full_reset)
+        await self._checkpoint_wal()
+        await self._report_status()
+        await self.scheduler.run()
+
+    def _schedule_daily_reset(self, scheduled_time: str, full_reset: bool):
+        now = datetime.now().astimezone()
+        reset_at = datetime.combine(now.date(), time.fromisoformat(scheduled_time))
+        reset_at = reset_at.astimezone()
+        if reset_at <= now:
+            reset_at += timedelta(days=1)
+        self.scheduler.call_at(
+            reset_at, "daily_reset", self._run_daily_reset, scheduled_time, full_reset
+        )
+
+    async def _run_daily_reset(self, scheduled_time: str, full_reset: bool):
+        self._schedule_daily_reset(scheduled_time, full_reset)
+        await self.daily_reset(True, full_reset)
+
+    async def _checkpoint_wal(self):
+        self.scheduler.call_at(
+            datetime.now(timezone.utc) + WAL_CHECKPOINT_INTERVAL,
+            "checkpoint_wal",
+            self._checkpoint_wal,
         )
-        while True:
-            schedule.run_pending()
-            await asyncio.sleep(300)
+        await sync_to_async(checkpoint_wal)()
 
-    async def daily_reset(self, reset_state: bool):
+    async def _report_status(self):
+        self.scheduler.call_at(
+            datetime.now(timezone.utc) + STATUS_REPORT_INTERVAL,
+            "report_status",
+            self._report_status,
+        )
+        await shared_state.report_scheduler_status(self.scheduler.pending())
+
+    async def daily_reset(
+        self, reset_state: bool, full_reset: bool = False, replay: bool = False
+    ):
         """
         Common initialization that should be scheduled to run every day.
+        The new roster is computed in memory, then diffed against the current one
+        and applied in a single transaction, so the roster is never empty.
+        Blackbaud responses are cached on disk, and only downloaded again if they changed;
+        with replay, the cached responses are used as is.
         """
         now = get_now()
         if now.month in [6, 7]:
             return
+        start_secs = asyncio.get_running_loop().time()
 
-        await FreeBlockToday.objects.all().adelete()
-        if reset_state:
-            await FreePeriodCheckIn.objects.all().adelete()
-            await Student.objects.all().adelete()
-            # if now.month == 8 and now.day == 1:
-            #     await Student.objects.all().adelete()
-            # else:
-            #     await Student.objects.all().aupdate(free_blocks=0)
-
-        from oauth.api import oauth_client
+        from oauth.client import blackbaud_client
+        from oauth.response_cache import response_cache
 
-        client = await oauth_client()
+        client = await blackbaud_client()
         today_as_str = now.strftime("%m-%d-%Y")
         senior_year = now.year if now.month < 7 else now.year + 1
 
         # Fetches blackbaud data
         results = await asyncio.gather(
-            client.get("/academics/rosters"),
-            client.get(
+            response_cache.get(client, "/academics/rosters", replay),
+            response_cache.get(
+                client,
                 f"/academics/schedules/master?level_num={US_LEVEL}"
                 f"&start_date={today_as_str}&end_date={today_as_str}",
+                replay,
+            ),
+            response_cache.get(
+                client, f"/users?roles={STUDENTS_ROLE}&grad_year={senior_year}", replay
             ),
-            client.get(f"/users?roles={STUDENTS_ROLE}&grad_year={senior_year}"),
         )
         for result in results:
             result.raise_for_status()
         rosters_res, calendar_res, seniors_res = results
 
-        # Resets the cached schedule for today
+        # Computes the schedule for today
+        self.free_blocks_today = {}
         calendar_data = calendar_res.json()
         for schedule_set in calendar_data["value"][0]["schedule_sets"]:
             for block in schedule_set["blocks"]:
@@ -113,53 +187,91 @@ class Command(BaseCommand):
                     minutes_ahead = 30
                 else:
                     minutes_ahead = 10
-                data = FreeBlockToday(
+                self.free_blocks_today[block["block"]] = FreeBlockToday(
                     block=block["block"],
                     start=fp_time - timedelta(minutes=minutes_ahead),
                     end=fp_time + timedelta(minutes=10),
                 )
-                self.free_blocks_today[block["block"]] = data
-                await data.asave()
             break
 
-        # Then, initialize the students and the free blocks they have
+        # Then, computes the students and the free blocks they have
         courses = rosters_res.json()
         seniors = seniors_res.json()["value"]
-        senior_emails = [
+        senior_emails = {
             data.get("email").lower() for data in seniors if data.get("email")
-        ]
+        }
+        students: dict[str, Student] = {}
         num_free_block_courses = 0
         for course in courses:
             maybe_free_block = self._free_block_of(course)
             if maybe_free_block:
                 num_free_block_courses += 1
-            students = await asyncio.gather(
-                *[
-                    self._get_student(user, maybe_free_block, senior_emails)
-                    for user in course["roster"]
-                ]
-            )
-            students = set(filter(None, students))
-            await asyncio.gather(*[s.asave() for s in students])
+            for user in course["roster"]:
+                self._add_student(students, user, maybe_free_block, senior_emails)
 
+        await sync_to_async(self._apply)(students, reset_state, full_reset)
+        # Makes every server process reload the new schedule and rosters.
+        await free_block_schedule.ainvalidate()
+        await block_rosters.ainvalidate()
+        await student_ids.ainvalidate()
+        self._schedule_reminders(self.free_blocks_today.values())
         logger.info(f"Num free blocks: {num_free_block_courses}")
+        logger.info(
+            f"Daily reset took {asyncio.get_running_loop().time() - start_secs:.2f} secs"
+        )
+
+    def _apply(self, students: dict[str, Student], reset_state: bool, full_reset: bool):
+        """
+        Writes today's schedule and diffs the roster against the Student table,
+        all in one transaction.
+        """
+        with transaction.atomic():
+            FreeBlockToday.objects.all().delete()
+            FreeBlockToday.objects.bulk_create(self.free_blocks_today.values())
+            if reset_state:
+                FreePeriodCheckIn.objects.all().delete()
+            if full_reset:
+                Student.objects.all().delete()
+
+            existing = {s.email: s for s in Student.objects.all()}
+            to_create = [s for email, s in students.items() if email not in existing]
+            to_update = [
+                s
+                for email, s in students.items()
+                if email in existing
+                and _student_fields(existing[email]) != _student_fields(s)
+            ]
+            to_delete = existing.keys() - students.keys()
 
-    async def _get_student(
-        self, user: dict, maybe_free_block: FreeBlock | None, senior_emails: list[str]
-    ) -> Student | None:
+            Student.objects.bulk_create(to_create, batch_size=500)
+            Student.objects.bulk_update(to_update, _SYNCED_FIELDS, batch_size=500)
+            Student.objects.filter(email__in=to_delete).delete()
+        logger.info(
+            f"Roster synced: {len(to_create)} added, {len(to_update)} updated, "
+            f"{len(to_delete)} removed."
+        )
+
+    def _add_student(
+        self,
+        students: dict[str, Student],
+        user: dict,
+        maybe_free_block: FreeBlock | None,
+        senior_emails: set[str],
+    ):
         # Get basic data from dict
         if user["leader"].get("type") == "Teacher":
-            return None
+            return
         data = user["user"]
         email = data["email"].lower().strip()
         if not email:
-            return None
+            return
 
         # Create student and set basic properties
-        student = await Student.objects.filter(email=email).afirst()
+        student = students.get(email)
         if not student:
-            student = Student(email=email)
+            student = students[email] = Student(email=email, free_blocks=0)
         student.is_senior = email in senior_emails
+        student.bb_id = data.get("id")
         if data.get("middle_name"):
             student.name = (
                 f"{data['first_name']} {data['middle_name']} {data['last_name']}"
@@ -167,20 +279,34 @@ class Command(BaseCommand):
         else:
             student.name = f"{data['first_name']} {data['last_name']}"
 
-        # Add free periods and register reminders
+        # Add free periods
         if maybe_free_block:
             if maybe_free_block not in self.free_blocks_today.keys():
                 raise Exception(
                     f"Free block {maybe_free_block} not found in today's calendar"
                 )
             student.free_blocks |= Student.as_bit_str(maybe_free_block)
-            end_time = self.free_blocks_today[maybe_free_block].end
-            reminder_time = (end_time - timedelta(minutes=7)).strftime("%H:%M")
-            schedule.every().day.at(reminder_time).do(
-                lambda: asyncio.create_task(_remind_student(student))
-            )
 
-        return student
+    def _schedule_reminders(self, free_blocks: Iterable[FreeBlockToday]):
+        """
+        Registers one reminder per free block, 7 minutes before it ends,
+        which notifies everyone who hasn't checked in yet at that point.
+        Reminders from a previous schedule are replaced.
+        """
+        for block in ALL_FREE_BLOCKS:
+            self.scheduler.cancel(f"remind:{block}")
+        now = datetime.now(timezone.utc)
+        for free_block in free_blocks:
+            reminder_time = free_block.end - timedelta(minutes=7)
+            if reminder_time <= now:
+                continue
+            self.scheduler.call_at(
+                reminder_time,
+                f"remind:{free_block.block}",
+                remind_free_block,
+                free_block.block,
+            )
+        logger.info(f"{self.scheduler.pending()} scheduled jobs pending.")
 
     def _free_block_of(self, course: dict) -> FreeBlock | None:
         now = get_now()
@@ -199,26 +325,8 @@ class Command(BaseCommand):
         return None
 
 
-async def _remind_student(student: Student):
-    data = await SubscriptionData.objects.filter(student=student).afirst()
-    if data:
-        try:
-            webpush(
-                subscription_info=data.subscription,
-                data="Looks like you haven't signed in for your free block - make sure to do that in 5 min.",
-                vapid_private_key=os.environ["VAPID_PRIVATE_KEY"],
-                vapid_claims={
-                    "sub": "mailto:" + data.student.email,
-                },
-            )
-        except WebPushException as ex:
-            # Mozilla returns additional information in the body of the response.
-            if ex.response is not None and ex.response.json():
-                extra = ex.response.json()
-                print(
-                    "Remote service replied with a {}:{}, {}",
-                    extra.code,
-                    extra.errno,
-                    extra.message,
-                )
-    return schedule.CancelJob()
+_SYNCED_FIELDS = ["name", "is_senior", "free_blocks", "bb_id"]
+
+
+def _student_fields(student: Student):
+    return student.name, student.is_senior, int(student.free_blocks), student.bb_id
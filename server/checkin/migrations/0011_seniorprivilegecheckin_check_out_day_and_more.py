@@ -0,0 +1,51 @@
+# Generated by Django 5.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+from checkin.core.consts import US_EASTERN
+
+
+def fill_check_out_day(apps, schema_editor):
+    SeniorPrivilegeCheckIn = apps.get_model("checkin", "SeniorPrivilegeCheckIn")
+    records = list(SeniorPrivilegeCheckIn.objects.only("id", "check_out_date"))
+    for record in records:
+        record.check_out_day = record.check_out_date.astimezone(US_EASTERN).date()
+    SeniorPrivilegeCheckIn.objects.bulk_update(
+        records, ["check_out_day"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("checkin", "0010_remove_freeblocktoday_time_freeblocktoday_end_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="seniorprivilegecheckin",
+            name="check_out_day",
+            field=models.DateField(null=True),
+        ),
+        migrations.RunPython(fill_check_out_day, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name="seniorprivilegecheckin",
+            name="check_out_day",
+            field=models.DateField(),
+        ),
+        migrations.AddIndex(
+            model_name="seniorprivilegecheckin",
+            index=models.Index(
+                fields=["student", "check_out_day"], name="sp_student_day_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="seniorprivilegecheckin",
+            index=models.Index(
+                fields=["check_out_day", "check_out_date"], name="sp_day_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="seniorprivilegecheckin",
+            index=models.Index(fields=["check_out_date", "id"], name="sp_date_id_idx"),
+        ),
+    ]
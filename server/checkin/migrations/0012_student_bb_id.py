@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("checkin", "0011_seniorprivilegecheckin_check_out_day_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="student",
+            name="bb_id",
+            field=models.PositiveIntegerField(db_index=True, null=True),
+        ),
+    ]
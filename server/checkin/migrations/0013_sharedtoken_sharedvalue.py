@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("checkin", "0012_student_bb_id"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SharedToken",
+            fields=[
+                (
+                    "token",
+                    models.CharField(max_length=36, primary_key=True, serialize=False),
+                ),
+                ("expires_at", models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="SharedValue",
+            fields=[
+                (
+                    "key",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("value", models.CharField(blank=True, max_length=200)),
+                ("version", models.PositiveBigIntegerField(default=0)),
+                ("updated_at", models.DateTimeField()),
+            ],
+        ),
+    ]
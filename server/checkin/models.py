@@ -18,6 +18,8 @@ class Student(models.Model):
     free_blocks = BitField(flags=ALL_FREE_BLOCKS, default=0)
     name = models.CharField(max_length=30, default="[Unknown]")
     is_senior = models.BooleanField(default=False)
+    # The student's Blackbaud user ID (the number students can enter instead of their email).
+    bb_id = models.PositiveIntegerField(null=True, db_index=True)
 
     @classmethod
     def as_bit_str(cls, free_block: FreeBlock) -> int:
@@ -71,12 +73,19 @@ class SeniorPrivilegeCheckIn(models.Model):
     device_id = models.CharField(max_length=32)
     checked_out = models.BooleanField()
     check_out_date = models.DateTimeField()
+    # check_out_date's day in US Eastern time, stored so that lookups by day can use an index
+    # (a __date lookup on check_out_date can't). It's set automatically on save().
+    check_out_day = models.DateField()
     check_in_date = models.DateTimeField(null=True)
     video = models.FileField(upload_to="checkin_vids/", blank=True)
 
     def name(self):
         return "sp_check_out" if self.checked_out else "sp_check_in"
 
+    def save(self, *args, **kwargs):
+        self.check_out_day = self.check_out_date.astimezone(US_EASTERN).date()
+        super().save(*args, **kwargs)
+
     def dict(self):
         """
         Fetches a dict representation of this model.
@@ -95,6 +104,17 @@ class SeniorPrivilegeCheckIn(models.Model):
             "date_str": date_fmt,
         }
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["student", "check_out_day"], name="sp_student_day_idx"
+            ),
+            models.Index(
+                fields=["check_out_day", "check_out_date"], name="sp_day_date_idx"
+            ),
+            models.Index(fields=["check_out_date", "id"], name="sp_date_id_idx"),
+        ]
+
 
 class FreeBlockToday(models.Model):
     """
@@ -120,9 +140,28 @@ class SeniorPrivilegesBan(models.Model):
         max_length=45, validators=[email_or_everyone], primary_key=True
     )
 
-    @classmethod
-    async def applies_to(cls, is_for: str):
-        return await cls.objects.filter(is_for=is_for).aexists()
+
+class SharedToken(models.Model):
+    """
+    A single-use user token, stored so that every server process can consume it
+    (see checkin.core.shared_state).
+    """
+
+    token = models.CharField(max_length=36, primary_key=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+
+class SharedValue(models.Model):
+    """
+    A small piece of state shared by every server process, like the kiosk token
+    or the version of a cache (see checkin.core.shared_state).
+    The version is bumped on every change, so changes can be made with compare-and-swap.
+    """
+
+    key = models.CharField(max_length=50, primary_key=True)
+    value = models.CharField(max_length=200, blank=True)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField()
 
 
 @receiver(post_delete, sender=SeniorPrivilegeCheckIn)
@@ -0,0 +1,231 @@
+"""
+Per-request timing and query counts, aggregated per route and exposed in Prometheus' text format,
+so that slow requests can be traced to the database, Blackbaud or FFmpeg.
+Calls to Blackbaud are also recorded individually, including those made outside requests.
+Metrics are kept per process.
+"""
+
+import logging
+import time
+import uuid
+
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.urls import Resolver404, resolve
+
+from config import settings
+from config.logging_util import log_ctx
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS_SECS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Time spent outside the server process, on each kind of external call.
+EXTERNAL_KINDS = ("blackbaud", "ffmpeg")
+
+
+@dataclass
+class RequestMetrics:
+    db_queries: int = 0
+    db_secs: float = 0.0
+    external_secs: dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(EXTERNAL_KINDS, 0.0)
+    )
+
+
+@dataclass
+class RouteMetrics:
+    requests: int = 0
+    errors: int = 0
+    secs: float = 0.0
+    bucket_counts: list[int] = field(
+        default_factory=lambda: [0] * len(LATENCY_BUCKETS_SECS)
+    )
+    db_queries: int = 0
+    db_secs: float = 0.0
+    external_secs: dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(EXTERNAL_KINDS, 0.0)
+    )
+
+    def record(self, secs: float, status: int, request_metrics: RequestMetrics):
+        self.requests += 1
+        self.errors += status >= 500
+        self.secs += secs
+        bucket = bisect_left(LATENCY_BUCKETS_SECS, secs)
+        if bucket < len(self.bucket_counts):
+            self.bucket_counts[bucket] += 1
+        self.db_queries += request_metrics.db_queries
+        self.db_secs += request_metrics.db_secs
+        for kind, kind_secs in request_metrics.external_secs.items():
+            self.external_secs[kind] += kind_secs
+
+
+@dataclass
+class ExternalCallMetrics:
+    calls: int = 0
+    secs: float = 0.0
+    bucket_counts: list[int] = field(
+        default_factory=lambda: [0] * len(LATENCY_BUCKETS_SECS)
+    )
+
+    def record(self, secs: float):
+        self.calls += 1
+        self.secs += secs
+        bucket = bisect_left(LATENCY_BUCKETS_SECS, secs)
+        if bucket < len(self.bucket_counts):
+            self.bucket_counts[bucket] += 1
+
+
+curr_request_metrics: ContextVar[RequestMetrics | None] = ContextVar(
+    "curr_request_metrics", default=None
+)
+route_metrics: dict[tuple[str, str], RouteMetrics] = defaultdict(RouteMetrics)
+# Every call to an external service, by kind and outcome (ex. the HTTP status).
+external_call_metrics: dict[tuple[str, str], ExternalCallMetrics] = defaultdict(
+    ExternalCallMetrics
+)
+
+
+@contextmanager
+def timed(kind: str):
+    """
+    Adds the time spent in the block to the current request's time on an external call,
+    ex. with timed("blackbaud"): ...
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics = curr_request_metrics.get()
+        if request_metrics is not None:
+            request_metrics.external_secs[kind] += time.perf_counter() - start
+
+
+def record_external_call(kind: str, outcome: str, secs: float):
+    """
+    Records a single call to an external service, whether or not it's part of a request.
+    """
+    external_call_metrics[kind, outcome].record(secs)
+
+
+def _time_query(execute, sql, params, many, context):
+    request_metrics = curr_request_metrics.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        request_metrics.db_queries += 1
+        request_metrics.db_secs += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    connection.execute_wrappers.append(_time_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Times every request, and records it under its route.
+    Requests slower than SLOW_REQUEST_SECS are logged with their breakdown.
+    """
+
+    sync_capable = False
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    async def __call__(self, request):
+        route = _route_of(request.path_info)
+        request_metrics = RequestMetrics()
+        token = curr_request_metrics.set(request_metrics)
+        start = time.perf_counter()
+        try:
+            with log_ctx(route=route, req=uuid.uuid4().hex[:6]):
+                response = await self.get_response(request)
+                secs = time.perf_counter() - start
+                if secs > settings.SLOW_REQUEST_SECS:
+                    logger.warning(
+                        f"Slow request: {secs * 1000:.0f} ms total, "
+                        f"{request_metrics.db_queries} queries in {request_metrics.db_secs * 1000:.0f} ms, "
+                        + ", ".join(
+                            f"{kind} {kind_secs * 1000:.0f} ms"
+                            for kind, kind_secs in request_metrics.external_secs.items()
+                        )
+                    )
+        finally:
+            curr_request_metrics.reset(token)
+        route_metrics[request.method, route].record(
+            secs, response.status_code, request_metrics
+        )
+        return response
+
+
+def _route_of(path: str) -> str:
+    try:
+        return "/" + resolve(path).route
+    except Resolver404:
+        return "[unmatched]"
+
+
+def render_prometheus(gauges: dict[str, float] | None = None) -> str:
+    """
+    Renders the metrics of every route in Prometheus' text exposition format,
+    followed by the given gauges (ex. ones read from the database).
+    """
+    routes = sorted(route_metrics.items())
+    lines = ["# TYPE http_request_duration_seconds histogram"]
+    for (method, route), metrics in routes:
+        labels = f'method="{method}",route="{route}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_SECS, metrics.bucket_counts):
+            cumulative += count
+            lines.append(
+                f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines += [
+            f'http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.requests}',
+            f"http_request_duration_seconds_sum{{{labels}}} {metrics.secs}",
+            f"http_request_duration_seconds_count{{{labels}}} {metrics.requests}",
+        ]
+    for name, value_of in _COUNTERS:
+        lines.append(f"# TYPE {name} counter")
+        for (method, route), metrics in routes:
+            labels = f'method="{method}",route="{route}"'
+            lines.append(f"{name}{{{labels}}} {value_of(metrics)}")
+    lines.append("# TYPE external_call_seconds_total counter")
+    for (method, route), metrics in routes:
+        for kind, kind_secs in metrics.external_secs.items():
+            labels = f'method="{method}",route="{route}",kind="{kind}"'
+            lines.append(f"external_call_seconds_total{{{labels}}} {kind_secs}")
+    lines.append("# TYPE external_call_duration_seconds histogram")
+    for (kind, outcome), metrics in sorted(external_call_metrics.items()):
+        labels = f'kind="{kind}",outcome="{outcome}"'
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_SECS, metrics.bucket_counts):
+            cumulative += count
+            lines.append(
+                f'external_call_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines += [
+            f'external_call_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.calls}',
+            f"external_call_duration_seconds_sum{{{labels}}} {metrics.secs}",
+            f"external_call_duration_seconds_count{{{labels}}} {metrics.calls}",
+        ]
+    for name, value in (gauges or {}).items():
+        lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+_COUNTERS = (
+    ("http_request_errors_total", lambda m: m.errors),
+    ("db_queries_total", lambda m: m.db_queries),
+    ("db_query_seconds_total", lambda m: m.db_secs),
+)
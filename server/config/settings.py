@@ -54,10 +54,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "config.metrics.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
-    "django.middleware.common.CommonMiddleware"
+    "django.middleware.common.CommonMiddleware",
 ]
 MIDDLEWARE += ["django.middleware.csrf.CsrfViewMiddleware"]
 MIDDLEWARE += [
@@ -74,12 +75,12 @@ if DEBUG:
         "http://169.254.17.243:5173",
         "http://127.0.0.1:5173",
         "https://coding-for-community.github.io",
-	    "https://crack-monkfish-monthly.ngrok-free.app"
+        "https://crack-monkfish-monthly.ngrok-free.app",
     ]
 else:
     CORS_ALLOWED_ORIGINS = [
         "https://coding-for-community.github.io",
-        "https://crack-monkfish-monthly.ngrok-free.app"
+        "https://crack-monkfish-monthly.ngrok-free.app",
     ]
 
 CSRF_TRUSTED_ORIGINS = [
@@ -90,7 +91,7 @@ CSRF_TRUSTED_ORIGINS = [
     "http://127.0.0.1:5173",
     "http://127.0.0.1:8001",
     "https://coding-for-community.github.io",
-    "https://crack-monkfish-monthly.ngrok-free.app"
+    "https://crack-monkfish-monthly.ngrok-free.app",
 ]
 
 CORS_ALLOW_CREDENTIALS = True
@@ -126,12 +127,37 @@ ASGI_APPLICATION = "config.asgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "dev.sqlite3" if DEBUG else "prod.sqlite3",
+# SQLite by default; set DB_ENGINE=postgresql (and install psycopg2-binary) to use PostgreSQL,
+# which lets concurrent check-ins write in parallel instead of waiting on SQLite's single writer.
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgresql":
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.postgresql",
+            "NAME": os.environ.get("DB_NAME", "chargerauth"),
+            "USER": os.environ.get("DB_USER", "chargerauth"),
+            "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+            "HOST": os.environ.get("DB_HOST", "127.0.0.1"),
+            "PORT": os.environ.get("DB_PORT", "5432"),
+            # Under ASGI, every request runs its queries on a different thread, so Django can't
+            # keep connections open itself, and opens one per request. So DB_HOST/DB_PORT must point
+            # at PgBouncer (in transaction mode), which makes that cheap. Django's own pool isn't an
+            # option: it needs psycopg 3, which django-bitfield's adapters don't work with.
+            "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+            "CONN_HEALTH_CHECKS": True,
+            "DISABLE_SERVER_SIDE_CURSORS": True,
+        }
+    }
+else:
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": os.environ.get(
+                "DB_NAME", BASE_DIR / "dev.sqlite3" if DEBUG else "prod.sqlite3"
+            ),
+        }
     }
-}
 
 
 # Password validation
@@ -170,9 +196,7 @@ USE_TZ = True
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 STATIC_URL = "http://127.0.0.1:8000/static/"
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, "admin", "static")
-]
+STATICFILES_DIRS = [os.path.join(BASE_DIR, "admin", "static")]
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -184,5 +208,53 @@ SESSION_COOKIE_HTTPONLY = True
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+# Tentative check-in videos are compressed in the background (see checkin.core.video_pipeline).
+# In "streaming" mode, they're instead piped through FFmpeg during the request without temp files,
+# which saves disk writes, but makes students wait for the compression.
+VIDEO_COMPRESSION_MODE = os.environ.get("VIDEO_COMPRESSION_MODE", "background")
+VIDEO_COMPRESSION_WORKERS = int(os.environ.get("VIDEO_COMPRESSION_WORKERS", 2))
+VIDEO_COMPRESSION_QUEUE_SIZE = int(os.environ.get("VIDEO_COMPRESSION_QUEUE_SIZE", 200))
+
+# If set, check-ins saved within this many milliseconds of each other are committed together
+# (see checkin.core.group_commit), which saves an fsync per check-in on SQLite.
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", 0))
+
+# Where the kiosk token, user tokens and cache versions are kept (see checkin.core.shared_state).
+# "memory" only works with a single server process; set it to "database" when running several.
+SHARED_STATE_BACKEND = os.environ.get("SHARED_STATE_BACKEND", "memory")
+# With "signed", kiosk and user tokens are signed with SECRET_KEY instead of stored
+# (see checkin.core.signed_tokens), so only used user tokens need to be stored.
+TOKEN_MODE = os.environ.get("TOKEN_MODE", "random")
+
+# Requests slower than this are logged with a breakdown of where the time went (see config.metrics).
+SLOW_REQUEST_SECS = float(os.environ.get("SLOW_REQUEST_SECS", 1))
+# If set, /metrics can be scraped with this as a bearer token (admins can always read it).
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN")
+
+# The SKY API allows 10 calls per second per subscription; requests beyond this are delayed
+# client-side instead of being rejected (see oauth.client).
+BLACKBAUD_RATE_LIMIT_PER_SEC = float(os.environ.get("BLACKBAUD_RATE_LIMIT_PER_SEC", 10))
+BLACKBAUD_MAX_CONNECTIONS = int(os.environ.get("BLACKBAUD_MAX_CONNECTIONS", 10))
+# If set, Blackbaud is replaced by a fake with this many students (see oauth.fake_sky_api),
+# whose responses are delayed by FAKE_BLACKBAUD_LATENCY_MS, and rate limited at FAKE_BLACKBAUD_429_RATIO.
+# The Blackbaud credentials (OAUTH_CLIENT_ID, etc.) don't need to be set then.
+FAKE_BLACKBAUD_STUDENTS = int(os.environ.get("FAKE_BLACKBAUD_STUDENTS", 0))
+FAKE_BLACKBAUD_LATENCY_MS = float(os.environ.get("FAKE_BLACKBAUD_LATENCY_MS", 0))
+FAKE_BLACKBAUD_429_RATIO = float(os.environ.get("FAKE_BLACKBAUD_429_RATIO", 0))
+# Where the daily reset's Blackbaud responses are cached (see oauth.response_cache).
+# The fake's responses are kept apart, so they're never replayed as real ones.
+BLACKBAUD_CACHE_DIR = os.environ.get(
+    "BLACKBAUD_CACHE_DIR",
+    os.path.join(
+        BASE_DIR,
+        "fake_blackbaud_cache" if FAKE_BLACKBAUD_STUDENTS else "blackbaud_cache",
+    ),
+)
+
+# The contact sent to push services with every web push, as a mailto: or https: URL.
+VAPID_SUBJECT = os.environ.get("VAPID_SUBJECT", f"https://{ALLOWED_HOSTS[0]}")
+# Signs web pushes (see notifs.push). Only needed once a push is sent.
+VAPID_PRIVATE_KEY = os.environ.get("VAPID_PRIVATE_KEY")
+
 with open("loggingConfig.json", "r") as f:
     LOGGING = json.loads(f.read())
@@ -1,9 +1,20 @@
+import os
+import sys
+
 import uvicorn
+from dotenv import load_dotenv
 
 if __name__ == "__main__":
+    load_dotenv()
+    workers = int(os.environ.get("SERVER_WORKERS", 1))
+    # Even with TOKEN_MODE=signed, workers need to share used tokens.
+    if workers > 1 and os.environ.get("SHARED_STATE_BACKEND", "memory") != "database":
+        sys.exit("SERVER_WORKERS > 1 requires SHARED_STATE_BACKEND=database")
     uvicorn.run(
         "config.asgi:application",
         host="127.0.0.1",
         port=8001,
-        reload=True,
+        workers=workers,
+        # Uvicorn can't reload with multiple workers.
+        reload=workers == 1,
     )
@@ -2,17 +2,19 @@
 Endpoints for push notification support.
 """
 
+import asyncio
 import os
 import ninja
 
 from dotenv import load_dotenv
 from ninja.errors import HttpError
-from pywebpush import webpush, WebPushException
+from pywebpush import WebPushException
 
 from checkin.core.errors import InvalidStudent
 from checkin.models import Student
 from config import settings
 from notifs.models import SubscriptionData
+from notifs.push import push_sender
 from notifs.schema import RegisterSchema, UnregisterSchema
 
 load_dotenv()
@@ -64,13 +66,10 @@ if settings.DEBUG:
         if data is None:
             return {"success": False}
         try:
-            webpush(
-                subscription_info=data.subscription,
-                data="Mary had a little lamb, with a nice mint jelly",
-                vapid_private_key=os.environ["VAPID_PRIVATE_KEY"],
-                vapid_claims={
-                    "sub": "mailto:" + student.email,
-                },
+            await asyncio.to_thread(
+                push_sender.send,
+                data.subscription,
+                "Mary had a little lamb, with a nice mint jelly",
             )
             return {"success": True}
         except WebPushException as ex:
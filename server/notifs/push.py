@@ -0,0 +1,81 @@
+"""
+A reusable web push sender, so that a wave of notifications doesn't
+re-parse the VAPID key, re-sign a JWT and open a new connection for every push.
+"""
+
+import threading
+import time
+
+import requests
+
+from django.core.exceptions import ImproperlyConfigured
+from py_vapid import Vapid02
+from pywebpush import webpush
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+
+from config import settings
+
+# Push services reject tokens that expire more than 24 hours out.
+JWT_TTL_SECS = 12 * 60 * 60
+JWT_REFRESH_MARGIN_SECS = 30 * 60
+
+
+class PushSender:
+    """
+    Sends web pushes with a VAPID key that is parsed once,
+    a signed JWT cached per push service origin until shortly before it expires,
+    and a pooled HTTP session per push service host.
+    Safe to use from multiple threads.
+    """
+
+    def __init__(self, private_key: str | None, subject: str, pool_size: int = 16):
+        self.subject = subject
+        self.pool_size = pool_size
+        self._private_key = private_key
+        self._vapid: Vapid02 | None = None
+        self._headers: dict[str, tuple[float, dict]] = {}
+        self._sessions: dict[str, requests.Session] = {}
+        self._lock = threading.Lock()
+
+    def send(self, subscription: dict, data: str, timeout_secs: float = 10):
+        """
+        Sends a push, raising a WebPushException if the push service rejects it.
+        """
+        url = urlsplit(subscription["endpoint"])
+        return webpush(
+            subscription_info=subscription,
+            data=data,
+            headers=self._auth_headers(f"{url.scheme}://{url.netloc}"),
+            requests_session=self._session(url.netloc),
+            timeout=timeout_secs,
+        )
+
+    def _auth_headers(self, audience: str) -> dict:
+        with self._lock:
+            expires_at, headers = self._headers.get(audience, (0, {}))
+            if expires_at - JWT_REFRESH_MARGIN_SECS > time.time():
+                return headers
+            if self._vapid is None:
+                if not self._private_key:
+                    raise ImproperlyConfigured(
+                        "Set VAPID_PRIVATE_KEY in the .env file to send web pushes."
+                    )
+                self._vapid = Vapid02.from_string(private_key=self._private_key)
+            expires_at = int(time.time()) + JWT_TTL_SECS
+            headers = self._vapid.sign(
+                {"sub": self.subject, "aud": audience, "exp": expires_at}
+            )
+            self._headers[audience] = expires_at, headers
+            return headers
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = requests.Session()
+                session.mount("https://", HTTPAdapter(pool_maxsize=self.pool_size))
+            return session
+
+
+push_sender = PushSender(settings.VAPID_PRIVATE_KEY, settings.VAPID_SUBJECT)
@@ -0,0 +1,74 @@
+"""
+Free block reminders, sent to every subscribed student who hasn't checked in yet.
+"""
+
+import asyncio
+import logging
+
+from django.db.models import Exists, OuterRef, QuerySet
+from pywebpush import WebPushException
+
+from checkin.core.consts import ALL_FREE_BLOCKS, FreeBlock
+from checkin.models import Student, FreePeriodCheckIn
+from notifs.models import SubscriptionData
+from notifs.push import push_sender
+
+logger = logging.getLogger(__name__)
+
+REMINDER_MSG = "Looks like you haven't signed in for your free block - make sure to do that in 5 min."
+MAX_CONCURRENT_SENDS = push_sender.pool_size
+
+# Push services answer with these when a subscription has expired or been revoked.
+_GONE_STATUSES = (404, 410)
+
+
+def subscriptions_to_remind(free_block: FreeBlock) -> QuerySet[SubscriptionData]:
+    """
+    The subscriptions of every student with the free block who hasn't checked in for it.
+    """
+    checked_in = FreePeriodCheckIn.objects.filter(
+        student=OuterRef("student"), free_block_idx=ALL_FREE_BLOCKS.index(free_block)
+    )
+    # Filtering a BitField by a Bit tests that one bit (free_blocks & bit = bit),
+    # so students with several free blocks are matched too.
+    return SubscriptionData.objects.filter(
+        student__free_blocks=Student.as_bit_str(free_block)
+    ).exclude(Exists(checked_in))
+
+
+async def remind_free_block(free_block: FreeBlock):
+    """
+    Sends a reminder to everyone who hasn't checked in for the free block,
+    then prunes the subscriptions that the push services say no longer exist.
+    """
+    subscriptions = [s async for s in subscriptions_to_remind(free_block)]
+    if not subscriptions:
+        return
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_SENDS)
+
+    async def send(data: SubscriptionData):
+        async with semaphore:
+            return await asyncio.to_thread(_send, data)
+
+    results = await asyncio.gather(*(send(s) for s in subscriptions))
+
+    gone = [
+        s.device_id for s, status in zip(subscriptions, results) if status == "gone"
+    ]
+    if gone:
+        await SubscriptionData.objects.filter(device_id__in=gone).adelete()
+    logger.info(
+        f"{free_block} block reminders: {results.count('sent')} sent, "
+        f"{results.count('failed')} failed, {len(gone)} expired subscriptions removed."
+    )
+
+
+def _send(data: SubscriptionData) -> str:
+    try:
+        push_sender.send(data.subscription, REMINDER_MSG)
+        return "sent"
+    except WebPushException as ex:
+        if ex.response is not None and ex.response.status_code in _GONE_STATUSES:
+            return "gone"
+        logger.warning(f"Reminder to {data.student_id} failed: {ex}")
+        return "failed"
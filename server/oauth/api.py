@@ -1,52 +1,14 @@
 """
-Stores an oauth-supporting httpx client that allows for access to the blackbaud API.
-Tokens are cached in the database and fetched upon startup.
-To generate a new token, run `py manage.py bboauth` in the terminal AFTER the server
-is started with `py main.py` on a different terminal.
+The Blackbaud OAuth flow's routes. The client itself is in oauth.client.
 """
 
-# import logging
-# import os
 # import ninja
 
-# from httpx import Timeout
 # from django.shortcuts import redirect
-# from authlib.integrations.httpx_client import AsyncOAuth2Client
-# from dotenv import load_dotenv
 # from config import settings
+# from oauth.client import oauth_client
 # from oauth.models import BlackbaudToken
 
-# load_dotenv()
-# os.environ["AUTHLIB_INSECURE_TRANSPORT"] = "1" if settings.DEBUG else "0"
-
-# logger = logging.getLogger(__name__)
-
-
-# async def oauth_client(fetch_token=True):
-#     """
-#     Fetches the oauth client, used for get requests to the blackbaud api.
-#     """
-#     if fetch_token and oauth.token is None:
-#         token = await BlackbaudToken.objects.afirst()
-#         oauth.token = token.to_dict() if token else None
-#         logger.info("Blackbaud token was just initialized.")
-#     return oauth
-
-
-# # noinspection PyUnusedLocal
-# async def __update_token_impl(token, refresh_token=None, access_token=None):
-#     await BlackbaudToken.reset_from_dict(token)
-
-
-# oauth = AsyncOAuth2Client(
-#     client_id=os.environ["OAUTH_CLIENT_ID"],
-#     client_secret=os.environ["OAUTH_CLIENT_SECRET"],
-#     update_token=__update_token_impl,
-#     token_endpoint="https://oauth2.sky.blackbaud.com/token",
-#     base_url="https://api.sky.blackbaud.com/school/v1/",
-#     timeout=Timeout(20.0, read=30.0),
-#     headers={"Bb-Api-Subscription-Key": os.environ["BLACKBAUD_SUBSCRIPTION_KEY"]},
-# )
 
 # router = ninja.Router()
 
@@ -0,0 +1,222 @@
+"""
+Stores an oauth-supporting httpx client that allows for access to the blackbaud API.
+Tokens are cached in the database and fetched upon startup.
+To generate a new token, run `py manage.py bboauth` in the terminal AFTER the server
+is started with `py main.py` on a different terminal.
+
+API calls should go through blackbaud_client(), which shares one connection pool,
+stays under the SKY API rate limit client-side, and retries rate limited or failed requests.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import time
+
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+
+import httpx
+from httpx import Limits, Timeout
+from authlib.integrations.httpx_client import AsyncOAuth2Client
+from dotenv import load_dotenv
+
+from config import settings
+from config.metrics import record_external_call, timed
+from oauth.models import BlackbaudToken
+
+load_dotenv()
+os.environ["AUTHLIB_INSECURE_TRANSPORT"] = "1" if settings.DEBUG else "0"
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+MAX_RETRIES = 4
+BACKOFF_BASE_SECS = 0.5
+BACKOFF_MAX_SECS = 30
+
+
+class TokenBucket:
+    """
+    An async rate limiter that allows bursts of up to `burst` calls,
+    refilled at rate_per_sec.
+    """
+
+    def __init__(self, rate_per_sec: float, burst: int):
+        self.rate_per_sec = rate_per_sec
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> float:
+        """
+        Waits until a call is allowed, returning the secs waited.
+        """
+        # The lock makes callers wait in order, instead of racing for each new token.
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate_per_sec
+            )
+            self._updated_at = now
+            wait_secs = max(0.0, (1 - self._tokens) / self.rate_per_sec)
+            if wait_secs:
+                await asyncio.sleep(wait_secs)
+                self._tokens += wait_secs * self.rate_per_sec
+                self._updated_at = time.monotonic()
+            self._tokens -= 1
+            return wait_secs
+
+
+class BlackbaudClient:
+    """
+    Makes rate limited, retried GET requests to the blackbaud api.
+    """
+
+    def __init__(self, oauth: AsyncOAuth2Client, limiter: TokenBucket):
+        self.oauth = oauth
+        self.limiter = limiter
+
+    async def get(
+        self,
+        url: str,
+        headers: dict[str, str] | None = None,
+        max_wait_secs: float = BACKOFF_MAX_SECS * MAX_RETRIES,
+    ) -> httpx.Response:
+        """
+        Sends a GET request, retrying it when it's rate limited, Blackbaud fails or the connection drops.
+        Once the next retry would wait longer than max_wait_secs in total,
+        the last response is returned (or the last error raised) instead.
+        """
+        waited_secs = 0.0
+        with timed("blackbaud"):
+            for attempt in range(MAX_RETRIES + 1):
+                waited_secs += await self.limiter.acquire()
+                res, error = await self._send(url, headers)
+                if res is not None and res.status_code not in RETRY_STATUSES:
+                    return res
+                delay = _retry_after_secs(res) or _backoff_secs(attempt)
+                if attempt == MAX_RETRIES or waited_secs + delay > max_wait_secs:
+                    break
+                reason = error or f"status {res.status_code}"
+                logger.warning(
+                    f"Blackbaud request {url} failed ({reason}); retrying in {delay:.1f} secs"
+                )
+                await asyncio.sleep(delay)
+                waited_secs += delay
+        if error:
+            raise error
+        return res
+
+    async def _send(
+        self, url: str, headers: dict[str, str] | None
+    ) -> tuple[httpx.Response | None, httpx.TransportError | None]:
+        start = time.perf_counter()
+        try:
+            res = await self.oauth.get(url, headers=headers)
+        except httpx.TransportError as e:
+            record_external_call("blackbaud", "error", time.perf_counter() - start)
+            return None, e
+        record_external_call(
+            "blackbaud", str(res.status_code), time.perf_counter() - start
+        )
+        return res, None
+
+
+def _retry_after_secs(res: httpx.Response | None) -> float | None:
+    value = res.headers.get("Retry-After") if res is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(
+            0.0,
+            (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(),
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def _backoff_secs(attempt: int) -> float:
+    # Jittered, so that requests rate limited together don't all retry together.
+    return min(BACKOFF_MAX_SECS, BACKOFF_BASE_SECS * 2**attempt) * random.uniform(
+        0.5, 1
+    )
+
+
+async def oauth_client(fetch_token=True):
+    """
+    Fetches the oauth client, used for the oauth flow.
+    Prefer blackbaud_client() for get requests to the blackbaud api.
+    """
+    if fetch_token and oauth.token is None:
+        token = await BlackbaudToken.objects.afirst()
+        oauth.token = token.to_dict() if token else None
+        logger.info("Blackbaud token was just initialized.")
+    return oauth
+
+
+async def blackbaud_client() -> BlackbaudClient:
+    """
+    Fetches the client used for get requests to the blackbaud api.
+    """
+    await oauth_client()
+    return blackbaud
+
+
+# noinspection PyUnusedLocal
+async def __update_token_impl(token, refresh_token=None, access_token=None):
+    await BlackbaudToken.reset_from_dict(token)
+
+
+def _credential(name: str) -> str:
+    # The fake SKY API doesn't check credentials, so they're optional with it (ex. in CI).
+    if settings.FAKE_BLACKBAUD_STUDENTS:
+        return os.environ.get(name, "fake")
+    return os.environ[name]
+
+
+def _fake_sky_api_kwargs() -> dict:
+    """
+    Points the client at the fake SKY API, with a token that never expires.
+    """
+    from oauth.fake_sky_api import FakeSkyApi
+
+    fake = FakeSkyApi(
+        settings.FAKE_BLACKBAUD_STUDENTS,
+        latency_secs=settings.FAKE_BLACKBAUD_LATENCY_MS / 1000,
+        rate_limit_ratio=settings.FAKE_BLACKBAUD_429_RATIO,
+    )
+    logger.warning(f"Using a fake Blackbaud with {fake.num_students} students.")
+    return {
+        "transport": fake.transport(),
+        "token": {"access_token": "fake", "token_type": "bearer"},
+    }
+
+
+oauth = AsyncOAuth2Client(
+    client_id=_credential("OAUTH_CLIENT_ID"),
+    client_secret=_credential("OAUTH_CLIENT_SECRET"),
+    update_token=__update_token_impl,
+    token_endpoint="https://oauth2.sky.blackbaud.com/token",
+    base_url="https://api.sky.blackbaud.com/school/v1/",
+    timeout=Timeout(20.0, read=30.0),
+    limits=Limits(
+        max_connections=settings.BLACKBAUD_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.BLACKBAUD_MAX_CONNECTIONS,
+    ),
+    headers={"Bb-Api-Subscription-Key": _credential("BLACKBAUD_SUBSCRIPTION_KEY")},
+    **(_fake_sky_api_kwargs() if settings.FAKE_BLACKBAUD_STUDENTS else {}),
+)
+blackbaud = BlackbaudClient(
+    oauth,
+    TokenBucket(
+        settings.BLACKBAUD_RATE_LIMIT_PER_SEC,
+        burst=max(1, int(settings.BLACKBAUD_RATE_LIMIT_PER_SEC)),
+    ),
+)
@@ -0,0 +1,165 @@
+"""
+A stand-in for the parts of the Blackbaud SKY API the server uses, so that the daily reset
+and ID lookups can run (and be timed) offline, without an OAuth token.
+Set FAKE_BLACKBAUD_STUDENTS to use it instead of Blackbaud, ex.
+    FAKE_BLACKBAUD_STUDENTS=2000 FAKE_BLACKBAUD_LATENCY_MS=300 py manage.py dailyreset
+"""
+
+import asyncio
+import random
+
+from datetime import datetime
+
+import httpx
+
+from checkin.core.consts import ALL_FREE_BLOCKS
+from checkin.core.get_now import get_now
+
+BLOCK_TIMES = {
+    "A": "08:40",
+    "B": "09:35",
+    "C": "10:30",
+    "D": "11:25",
+    "E": "13:00",
+    "F": "13:55",
+    "G": "14:50",
+}
+FIRST_NAMES = ("Ava", "Ben", "Chloe", "Dev", "Emma", "Finn", "Grace", "Hugo", "Isla")
+LAST_NAMES = (
+    "Adams",
+    "Brown",
+    "Chen",
+    "Diaz",
+    "Evans",
+    "Garcia",
+    "Kim",
+    "Lee",
+    "Patel",
+)
+SUBJECTS = ("English", "Math", "Biology", "History", "Spanish", "Chemistry", "Art")
+CLASS_SIZE = 16
+
+
+class FakeSkyApi:
+    """
+    Serves deterministic rosters, a master schedule and users for num_students students,
+    each with a course or free period in every block.
+    Every response is delayed by latency_secs, and a rate_limit_ratio of requests
+    are rejected with a 429, like the real API does when over quota.
+    """
+
+    def __init__(
+        self,
+        num_students: int,
+        free_ratio: float = 0.3,
+        latency_secs: float = 0.0,
+        rate_limit_ratio: float = 0.0,
+        seed: int = 0,
+    ):
+        self.num_students = num_students
+        self.free_ratio = free_ratio
+        self.latency_secs = latency_secs
+        self.rate_limit_ratio = rate_limit_ratio
+        self._random = random.Random(seed)
+        self._users = [self._user(i) for i in range(num_students)]
+        self._rosters: dict[str, list] = {}
+
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency_secs)
+        if self._random.random() < self.rate_limit_ratio:
+            return httpx.Response(429, headers={"Retry-After": "1"})
+        path = request.url.path.removeprefix("/school/v1")
+        params = request.url.params
+        if path == "/academics/rosters":
+            return httpx.Response(200, json=self._courses())
+        elif path == "/academics/schedules/master":
+            return httpx.Response(200, json=self._schedule(params["start_date"]))
+        elif path == "/users":
+            grad_year = int(params.get("grad_year", 0))
+            users = [u for u in self._users if u["grad_year"] == grad_year]
+            return httpx.Response(200, json={"count": len(users), "value": users})
+        elif path.startswith("/users/") and path[len("/users/") :].isdigit():
+            bb_id = int(path[len("/users/") :]) - 1000
+            if 0 <= bb_id < self.num_students:
+                return httpx.Response(200, json=self._users[bb_id])
+        return httpx.Response(404, json={"message": "Not found"})
+
+    def _user(self, i: int) -> dict:
+        first = FIRST_NAMES[i % len(FIRST_NAMES)]
+        last = LAST_NAMES[i // len(FIRST_NAMES) % len(LAST_NAMES)]
+        return {
+            "id": 1000 + i,
+            "email": f"{first}.{last}{i}@example.org".lower(),
+            "first_name": first,
+            "middle_name": "",
+            "last_name": last,
+            "grad_year": _senior_year() + i % 4,
+        }
+
+    def _courses(self) -> list:
+        # Semesters are named after the current one, since only those free periods count.
+        semester = "S2" if get_now().month <= 5 else "S1"
+        if semester not in self._rosters:
+            self._rosters[semester] = self._make_courses(semester)
+        return self._rosters[semester]
+
+    def _make_courses(self, semester: str) -> list:
+        rng = random.Random(self.num_students)
+        courses = []
+        for block in ALL_FREE_BLOCKS:
+            free = []
+            in_class = []
+            for user in self._users:
+                (free if rng.random() < self.free_ratio else in_class).append(user)
+            courses.append(
+                _course(f"Free Period {semester} - {block}", block, free, rng)
+            )
+            for n, start in enumerate(range(0, len(in_class), CLASS_SIZE)):
+                subject = SUBJECTS[n % len(SUBJECTS)]
+                courses.append(
+                    _course(
+                        f"{subject} {n + 1} {semester}",
+                        block,
+                        in_class[start : start + CLASS_SIZE],
+                        rng,
+                    )
+                )
+        return courses
+
+    def _schedule(self, date_str: str) -> dict:
+        date = datetime.strptime(date_str, "%m-%d-%Y").date().isoformat()
+        blocks = [
+            {"block": block, "start_time": f"{date}T{start}:00"}
+            for block, start in BLOCK_TIMES.items()
+        ]
+        blocks.insert(4, {"block": "Lunch", "start_time": f"{date}T12:15:00"})
+        return {"count": 1, "value": [{"schedule_sets": [{"blocks": blocks}]}]}
+
+
+def _course(name: str, block: str, users: list, rng: random.Random) -> dict:
+    teacher = {
+        "leader": {"type": "Teacher"},
+        "user": {
+            "id": rng.randint(100, 999),
+            "email": f"teacher{rng.randint(1, 200)}@example.org",
+            "first_name": "Pat",
+            "last_name": "Teacher",
+        },
+    }
+    students = [{"leader": {"type": "Student"}, "user": user} for user in users]
+    return {
+        "section": {
+            "id": rng.randint(10**6, 10**7),
+            "name": name,
+            "block": {"name": block},
+        },
+        "roster": [teacher, *students],
+    }
+
+
+def _senior_year() -> int:
+    now = get_now()
+    return now.year if now.month < 7 else now.year + 1
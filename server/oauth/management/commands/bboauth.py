@@ -2,7 +2,7 @@ import asyncio
 import webbrowser
 
 from django.core.management import BaseCommand
-from oauth.api import oauth_client
+from oauth.client import oauth_client
 
 
 class Command(BaseCommand):
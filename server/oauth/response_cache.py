@@ -0,0 +1,120 @@
+"""
+An on-disk cache of Blackbaud responses, so that payloads that rarely change
+(like the rosters) are only downloaded again when they do.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import time
+
+import httpx
+
+from config import settings
+from oauth.client import RETRY_STATUSES, BlackbaudClient
+
+logger = logging.getLogger(__name__)
+
+
+class NotCached(Exception):
+    pass
+
+
+class ResponseCache:
+    """
+    Stores the body of each url's last successful response, gzipped, with its ETag and Last-Modified,
+    and re-fetches it with a conditional request.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    async def get(
+        self, client: BlackbaudClient, url: str, replay: bool = False
+    ) -> httpx.Response:
+        """
+        Fetches a url, returning the cached body if Blackbaud says it hasn't changed,
+        or if Blackbaud is still down (or rate limiting) after the client's retries.
+        With replay, the cached body is returned without contacting Blackbaud at all.
+        """
+        entry = self._read(url)
+        if replay:
+            if entry is None:
+                raise NotCached(url)
+            logger.info(f"Replaying {url} from {_fmt_age(entry)} ago")
+            return _response_of(entry)
+
+        headers = {}
+        if entry and entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            res = await client.get(url, headers=headers)
+        except httpx.TransportError as e:
+            if entry is None:
+                raise
+            logger.warning(
+                f"{url} failed ({e!r}); using the response from {_fmt_age(entry)} ago instead"
+            )
+            return _response_of(entry)
+        if res.status_code == 304 and entry:
+            logger.info(f"{url} is unchanged")
+            return _response_of(entry, res.request)
+        if res.is_success:
+            self._write(url, res)
+        elif res.status_code in RETRY_STATUSES and entry:
+            logger.warning(
+                f"{url} failed (status {res.status_code}); "
+                f"using the response from {_fmt_age(entry)} ago instead"
+            )
+            return _response_of(entry, res.request)
+        return res
+
+    def _path_of(self, url: str) -> str:
+        key = hashlib.sha256(url.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, f"{key}.json.gz")
+
+    def _read(self, url: str) -> dict | None:
+        try:
+            with gzip.open(self._path_of(url), "rt", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Guards against a (very unlikely) hash collision.
+        return entry if entry.get("url") == url else None
+
+    def _write(self, url: str, res: httpx.Response):
+        entry = {
+            "url": url,
+            "etag": res.headers.get("ETag"),
+            "last_modified": res.headers.get("Last-Modified"),
+            "content_type": res.headers.get("Content-Type"),
+            "fetched_at": time.time(),
+            "body": res.text,
+        }
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path_of(url)
+        # Written to a temp file first, so a crash never leaves a half-written entry.
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(path + ".tmp", path)
+
+
+def _response_of(entry: dict, request: httpx.Request | None = None) -> httpx.Response:
+    headers = {"Content-Type": entry["content_type"] or "application/json"}
+    return httpx.Response(
+        200,
+        headers=headers,
+        text=entry["body"],
+        request=request or httpx.Request("GET", entry["url"]),
+    )
+
+
+def _fmt_age(entry: dict) -> str:
+    return f"{(time.time() - entry['fetched_at']) / 3600:.1f} hours"
+
+
+response_cache = ResponseCache(settings.BLACKBAUD_CACHE_DIR)